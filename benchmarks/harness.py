@@ -0,0 +1,376 @@
+"""
+部署与 TaskManager 的基准/压测工具。
+
+在本机启动仅 CPU 的 Ray 集群，部署可配置服务时间、输出大小与失败率的合成任务类，依次运行以下场景：
+
+- inference：闭环，concurrency 个线程循环调用 inference(handle 同步推理)；
+- inference_url：闭环，concurrency 个线程循环调用 inference_url；
+- batch_forward：batch_forward_iter(有序，即 batch_forward)，在途上限为 concurrency；
+- batch_forward_url：batch_forward_url，可用 --http-batch 走 /batch 接口(仅统计吞吐)；
+- open_loop：开环，按泊松过程以 --rate 的到达率持续 --duration 秒通过 handle 发请求，不等待前序请求完成；
+- task_manager：加载任务到 SQLite 后 run_tasks，统计任务吞吐、批次延迟与数据库操作次数。
+
+输出各场景的 p50/p95/p99 延迟、每秒条数(及数据库每秒操作数)，结果保存为 JSON，
+可通过 --compare 与之前保存的结果对比，便于发现版本间的性能回退。
+
+用法:
+    python -m benchmarks.harness --scenarios inference,batch_forward,task_manager --service-time 0.01
+    python -m benchmarks.harness --compare benchmarks/results/bench-20240101-120000.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import ray
+from multinode.multinode_deployment import MultiNodeDeployment
+from multinode.deployment_wrapper import read_http_input
+from multinode.task_manager import TaskManager, RetryPolicy, SQLiteTaskStore, TaskStatus
+
+SCENARIOS = ["inference", "inference_url", "batch_forward", "batch_forward_url", "open_loop", "task_manager"]
+
+
+def make_processor(service_time: float, jitter: float, failure_rate: float, output_bytes: int):
+    """生成合成任务类：每次调用等待约 service_time 秒(正态抖动)，以 failure_rate 的概率抛出异常"""
+    from starlette.requests import Request
+
+    def service_delay():
+        return max(0.0, random.gauss(service_time, service_time * jitter))
+
+    class SyntheticProcessor:
+        async def __call__(self, x=None, *args, **kwargs):
+            if isinstance(x, Request):
+                x = await read_http_input(x)
+            await asyncio.sleep(service_delay())
+            if random.random() < failure_rate:
+                raise RuntimeError("synthetic failure")
+            return "y" * output_bytes
+
+        async def batch_call(self, inputs):
+            # 批处理时整批耗时一次服务时间，模拟 GPU 批推理
+            await asyncio.sleep(service_delay())
+            if random.random() < 1 - (1 - failure_rate) ** len(inputs):
+                raise RuntimeError("synthetic failure")
+            return ["y" * output_bytes for _ in inputs]
+
+    return SyntheticProcessor
+
+
+def make_payloads(n: int, payload_bytes: int):
+    return [f"{i}:" + "x" * payload_bytes for i in range(n)]
+
+
+def summarize(latencies, elapsed: float, errors: int = 0, items: int = None, **extra) -> dict:
+    """汇总延迟(毫秒)分位数与吞吐"""
+    items = len(latencies) + errors if items is None else items
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000 if ordered else None
+
+    latency = None
+    if ordered:
+        latency = {"mean": sum(ordered) / len(ordered) * 1000, "p50": percentile(50), "p95": percentile(95),
+                   "p99": percentile(99), "max": ordered[-1] * 1000}
+    return dict({"items": items, "errors": errors, "elapsed_s": elapsed,
+                 "items_per_sec": items / elapsed if elapsed else None, "latency_ms": latency}, **extra)
+
+
+def is_error(result) -> bool:
+    return isinstance(result, dict) and "error" in result
+
+
+# ---------------- 场景 ----------------
+def closed_loop(call, payloads, concurrency: int) -> dict:
+    latencies, errors = [], 0
+    cursor = iter(payloads)
+
+    def worker():
+        nonlocal errors
+        for payload in cursor:          # 多线程共享同一个迭代器，每条输入只被取一次
+            start = time.perf_counter()
+            try:
+                failed = is_error(call(payload))
+            except Exception:
+                failed = True
+            if failed:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    # inference / inference_url 会打印每条结果，压测期间屏蔽输出
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def bench_inference(multinode_depoly, config) -> dict:
+    return closed_loop(multinode_depoly.inference, make_payloads(config.num_requests, config.payload_bytes),
+                       config.concurrency)
+
+
+def bench_inference_url(multinode_depoly, config) -> dict:
+    return closed_loop(multinode_depoly.inference_url, make_payloads(config.num_requests, config.payload_bytes),
+                       config.concurrency)
+
+
+def bench_batch_forward(multinode_depoly, config) -> dict:
+    payloads = make_payloads(config.num_requests, config.payload_bytes)
+    submitted = {}
+
+    def inputs():
+        # 输入按需拉取，拉取时刻即请求提交时刻
+        for index, payload in enumerate(payloads):
+            submitted[index] = time.perf_counter()
+            yield payload
+
+    async def run():
+        latencies = []
+        async for index, _ in multinode_depoly.batch_forward_iter(inputs(), max_in_flight=config.concurrency):
+            latencies.append(time.perf_counter() - submitted[index])
+        return latencies
+
+    start = time.perf_counter()
+    try:
+        latencies = asyncio.run(run())
+    except Exception as e:
+        # batch_forward 遇到失败的输入即抛出异常
+        return {"aborted": f"{type(e).__name__}: {e}"[:500], "elapsed_s": time.perf_counter() - start}
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def bench_batch_forward_url(multinode_depoly, config) -> dict:
+    payloads = make_payloads(config.num_requests, config.payload_bytes)
+    start = time.perf_counter()
+    results = asyncio.run(multinode_depoly.batch_forward_url(payloads, max_concurrency=config.concurrency,
+                                                             batch_size=config.http_batch))
+    elapsed = time.perf_counter() - start
+    return summarize([], elapsed, errors=sum(1 for r in results if is_error(r)), items=len(results))
+
+
+def bench_open_loop(multinode_depoly, config) -> dict:
+    handle = multinode_depoly.deployment_handle
+
+    async def run():
+        latencies, errors, tasks = [], 0, []
+
+        async def one(payload):
+            nonlocal errors
+            start = time.perf_counter()
+            try:
+                await handle.remote(payload)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+        payload = make_payloads(1, config.payload_bytes)[0]
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        next_arrival = start
+        while next_arrival - start < config.duration:
+            await asyncio.sleep(max(0.0, next_arrival - loop.time()))
+            tasks.append(asyncio.create_task(one(payload)))
+            next_arrival += random.expovariate(config.rate)
+        await asyncio.gather(*tasks)
+        return latencies, errors, loop.time() - start
+
+    latencies, errors, elapsed = asyncio.run(run())
+    return summarize(latencies, elapsed, errors, offered_rate=config.rate)
+
+
+class CountingStore:
+    """统计任务存储各方法的调用次数，其余行为委托给被包装的存储"""
+
+    def __init__(self, store):
+        self._store = store
+        self.ops = Counter()
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if not callable(attr):
+            return attr
+
+        def counted(*args, **kwargs):
+            self.ops[name] += 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+class TimedEngine:
+    """记录每次 batch_forward 的耗时"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.latencies = []
+
+    async def batch_forward(self, inputs):
+        start = time.perf_counter()
+        try:
+            return await self.engine.batch_forward(inputs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+def bench_task_manager(multinode_depoly, config) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CountingStore(SQLiteTaskStore(f"sqlite:///{tmp}/bench.db", "bench_tasks"))
+        engine = TimedEngine(multinode_depoly)
+        manager = TaskManager("bench_tasks", engine, store=store, batch_size=config.tm_batch_size,
+                              retry_policy=RetryPolicy(max_retries=3, backoff_base=0.05, backoff_max=0.5))
+        payloads = make_payloads(config.num_requests, config.payload_bytes)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            manager.load_tasks(payloads)
+            load_elapsed = time.perf_counter() - start
+            load_ops = sum(store.ops.values())
+            store.ops.clear()
+            start = time.perf_counter()
+            manager.run_tasks(max_in_flight=config.tm_in_flight, status_interval=float("inf"))
+            elapsed = time.perf_counter() - start
+        counts = manager._count_by_status()
+        store.close()
+    ops = dict(store.ops)
+    return summarize(engine.latencies, elapsed, errors=counts[TaskStatus.FAILED], items=len(payloads),
+                     latency_kind="batch", load_rows_per_sec=len(payloads) / load_elapsed, load_db_ops=load_ops,
+                     db_ops=ops, db_ops_per_sec=sum(ops.values()) / elapsed, status=counts)
+
+
+BENCHMARKS = {
+    "inference": bench_inference,
+    "inference_url": bench_inference_url,
+    "batch_forward": bench_batch_forward,
+    "batch_forward_url": bench_batch_forward_url,
+    "open_loop": bench_open_loop,
+    "task_manager": bench_task_manager,
+}
+
+
+# ---------------- 输出与对比 ----------------
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "git_commit": commit, "python": platform.python_version(),
+            "ray": ray.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count()}
+
+
+def format_row(name: str, result: dict) -> str:
+    if "aborted" in result:
+        return f"{name:<18} 中止: {result['aborted'][:80]}"
+    latency = result["latency_ms"] or {}
+
+    def ms(key):
+        return f"{latency[key]:>9.1f}" if latency.get(key) is not None else f"{'-':>9}"
+    row = f"{name:<18}{result['items_per_sec']:>10.1f}{ms('p50')}{ms('p95')}{ms('p99')}{result['errors']:>7}"
+    if "db_ops_per_sec" in result:
+        row += f"   数据库 {result['db_ops_per_sec']:.1f} 次/s"
+    return row
+
+
+def print_results(results: dict):
+    print(f"\n{'场景':<16}{'条/s':>10}{'p50(ms)':>9}{'p95(ms)':>9}{'p99(ms)':>9}{'失败':>5}")
+    for name, result in results.items():
+        print(format_row(name, result))
+
+
+def compare(baseline: dict, current: dict):
+    """对比两次结果的吞吐与 p99 延迟"""
+    print(f"\n对比基线 {baseline['environment'].get('git_commit')} ({baseline['environment']['timestamp']}):")
+    print(f"{'场景':<16}{'条/s 基线':>12}{'条/s 当前':>12}{'变化':>9}{'p99 基线':>11}{'p99 当前':>11}{'变化':>9}")
+
+    def change(old, new):
+        return f"{(new - old) / old * 100:>+8.1f}%" if old and new is not None else f"{'-':>9}"
+
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if not old or "aborted" in old or "aborted" in result:
+            continue
+        old_p99 = (old.get("latency_ms") or {}).get("p99")
+        new_p99 = (result.get("latency_ms") or {}).get("p99")
+        print(f"{name:<18}{old['items_per_sec']:>12.1f}{result['items_per_sec']:>12.1f}"
+              f"{change(old['items_per_sec'], result['items_per_sec'])}"
+              f"{old_p99 or 0:>11.1f}{new_p99 or 0:>11.1f}{change(old_p99, new_p99)}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔的场景名")
+    parser.add_argument("--num-cpus", type=int, default=os.cpu_count(), help="本地 Ray 集群的 CPU 数")
+    parser.add_argument("--replicas", type=int, default=1)
+    parser.add_argument("--replica-cpus", type=float, default=0.1, help="每个副本占用的 CPU(合成任务不消耗 CPU)")
+    parser.add_argument("--max-ongoing-requests", type=int, default=100)
+    parser.add_argument("--server-batch", type=int, default=None, help="开启服务端动态批处理的 max_batch_size")
+    parser.add_argument("--service-time", type=float, default=0.01, help="每次调用(或每批)的服务时间(秒)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="服务时间的相对标准差")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--payload-bytes", type=int, default=256)
+    parser.add_argument("--output-bytes", type=int, default=256)
+    parser.add_argument("--num-requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--http-batch", type=int, default=None, help="batch_forward_url 每个请求合并的输入数")
+    parser.add_argument("--rate", type=float, default=200, help="开环场景的请求到达率(条/秒)")
+    parser.add_argument("--duration", type=float, default=10, help="开环场景的持续时间(秒)")
+    parser.add_argument("--tm-batch-size", type=int, default=64)
+    parser.add_argument("--tm-in-flight", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--output", default=None, help="结果 JSON 路径，缺省为 benchmarks/results/bench-<时间>.json")
+    parser.add_argument("--compare", default=None, help="用于对比的历史结果 JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    config = parse_args(argv)
+    scenarios = [name.strip() for name in config.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(BENCHMARKS)
+    if unknown:
+        sys.exit(f"unknown scenarios: {sorted(unknown)}, available: {SCENARIOS}")
+
+    ray.init(num_cpus=config.num_cpus, num_gpus=0)
+    multinode_depoly = MultiNodeDeployment()
+    multinode_depoly.initialize_deployment(
+        name="bench", task_processor=make_processor(config.service_time, config.jitter, config.failure_rate,
+                                                    config.output_bytes),
+        min_replicas=config.replicas, max_replicas=config.replicas, num_cpus=config.replica_cpus,
+        max_ongoing_requests=config.max_ongoing_requests,
+        batching={"max_batch_size": config.server_batch} if config.server_batch else None)
+    multinode_depoly.run(port=config.port, report_replicas=False)
+    multinode_depoly.http_client.max_concurrency = max(multinode_depoly.http_client.max_concurrency,
+                                                       config.concurrency)
+
+    results = {}
+    try:
+        for name in scenarios:
+            print(f"运行场景 {name} ...")
+            results[name] = BENCHMARKS[name](multinode_depoly, config)
+    finally:
+        multinode_depoly.shut_down("bench")
+
+    report = {"environment": environment(), "config": vars(config), "results": results}
+    print_results(results)
+    output = config.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                                           f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存至 {output}")
+
+    if config.compare:
+        with open(config.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+导入与启动耗时基准：每个测量在新的子进程中进行，避免模块缓存的影响。
+
+- 导入：各 multinode 模块的导入耗时(取多次中位数)，以及导入后已加载的重量级依赖；
+- 启动：MultiNodeDeployment(lazy=True) 与默认(立即连接 Ray)构造的耗时，以及 lazy 模式首次 connect 的耗时。
+
+可配合 python -X importtime -c "import multinode.multinode_deployment" 查看逐模块的导入耗时。
+
+用法:
+    python -m benchmarks.startup --repeat 5
+    python -m benchmarks.startup --skip-connect          # 只测导入，不启动 Ray
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+MODULES = ["multinode.metrics", "multinode.http_client", "multinode.task_store", "multinode.task_manager",
+           "multinode.multinode_deployment", "multinode.deployment_wrapper", "multinode.sqlite_task_store"]
+HEAVY_DEPENDENCIES = ["ray", "ray.serve", "sqlalchemy", "fastapi", "aiohttp", "requests", "numpy"]
+
+IMPORT_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+STARTUP_SCRIPT = """
+import io, sys, time, json, contextlib
+start = time.perf_counter()
+from multinode.multinode_deployment import MultiNodeDeployment
+imported = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    deploy = MultiNodeDeployment({address!r}, lazy={lazy})
+    constructed = time.perf_counter()
+    deploy.connect()
+connected = time.perf_counter()
+print(json.dumps({{"import": imported - start, "construct": constructed - imported,
+                  "connect": connected - constructed, "total": connected - start}}))
+"""
+
+
+def run_script(script: str) -> dict:
+    output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_imports(repeat: int) -> dict:
+    results = {}
+    for module in MODULES:
+        runs = [run_script(IMPORT_SCRIPT.format(module=module, heavy=HEAVY_DEPENDENCIES)) for _ in range(repeat)]
+        results[module] = {"ms": statistics.median(run["seconds"] for run in runs) * 1000,
+                           "loaded": runs[-1]["loaded"]}
+    return results
+
+
+def bench_startup(address: str, repeat: int) -> dict:
+    results = {}
+    for lazy in (True, False):
+        runs = [run_script(STARTUP_SCRIPT.format(address=address, lazy=lazy)) for _ in range(repeat)]
+        results["lazy" if lazy else "eager"] = {key: statistics.median(run[key] for run in runs) * 1000
+                                                for key in runs[0]}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ray-address", default=None, help="缺省每次启动本地 Ray，建议指定已有集群(如 auto)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-connect", action="store_true", help="只测导入耗时")
+    parser.add_argument("--output", default=None, help="结果保存为 JSON")
+    args = parser.parse_args()
+
+    result = {"imports": bench_imports(args.repeat)}
+    print(f"\n导入耗时(中位数，{args.repeat} 次):")
+    print(f"{'模块':<34}{'耗时(ms)':>10}  已加载的重量级依赖")
+    for module, item in result["imports"].items():
+        print(f"{module:<34}{item['ms']:>10.1f}  {', '.join(item['loaded']) or '-'}")
+
+    if not args.skip_connect:
+        result["startup"] = bench_startup(args.ray_address, args.repeat)
+        print("\nMultiNodeDeployment 启动耗时(ms，中位数):")
+        print(f"{'模式':<8}{'导入':>10}{'构造':>10}{'连接':>10}{'合计':>10}")
+        for mode, item in result["startup"].items():
+            print(f"{mode:<8}{item['import']:>10.1f}{item['construct']:>10.1f}{item['connect']:>10.1f}"
+                  f"{item['total']:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+HTTP 推理路径的编码格式对比：JSON vs msgpack，逐条请求 vs /batch 批量接口。
+
+部署一个接收数值数组、返回其前 16 维的任务类，分别用四种方式发送相同的 N 条数组输入，输出耗时与吞吐。
+
+用法:
+    python -m benchmarks.wire_format --num-inputs 2000 --dim 1024 --batch-size 64
+"""
+import time
+import asyncio
+import argparse
+import numpy as np
+from starlette.requests import Request
+from multinode.multinode_deployment import MultiNodeDeployment
+from multinode.http_client import HttpClient
+
+
+class ArrayProcessor:
+    async def __call__(self, x, *args, **kwargs):
+        if isinstance(x, Request):      # 逐条 JSON 请求原样交给任务类，自行解析
+            x = (await x.json())["input"]
+        x = np.asarray(x, dtype=np.float32)
+        return x[:16] * 2
+
+
+def run_case(multinode_depoly, wire_format: str, inputs, batch_size: int = None, max_concurrency: int = 32):
+    multinode_depoly.http_client = HttpClient(max_concurrency=max_concurrency, wire_format=wire_format)
+    # JSON 无法直接编码数组，需先转为列表，转换耗时计入 JSON 的开销
+    start = time.perf_counter()
+    payloads = [x.tolist() for x in inputs] if wire_format == "json" else inputs
+    results = asyncio.run(multinode_depoly.batch_forward_url(payloads, batch_size=batch_size))
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for r in results if isinstance(r, dict) and "error" in r)
+    return elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ray-address", default=None)
+    parser.add_argument("--port", type=int, default=8500)
+    parser.add_argument("--num-inputs", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    multinode_depoly = MultiNodeDeployment(args.ray_address)
+    multinode_depoly.initialize_deployment(name="bench_wire", task_processor=ArrayProcessor,
+                                           num_cpus=0.5, max_ongoing_requests=64)
+    multinode_depoly.run(port=args.port, report_replicas=False)
+
+    inputs = [np.random.rand(args.dim).astype(np.float32) for _ in range(args.num_inputs)]
+    cases = [("json", None), ("msgpack", None), ("json", args.batch_size), ("msgpack", args.batch_size)]
+    run_case(multinode_depoly, "msgpack", inputs[:50], args.batch_size)    # 预热连接与副本
+
+    print(f"\n{args.num_inputs} 条 float32[{args.dim}] 输入:")
+    print(f"{'格式':<10}{'请求方式':<14}{'耗时(s)':>10}{'吞吐(条/s)':>14}{'失败':>6}")
+    for wire_format, batch_size in cases:
+        elapsed, failed = run_case(multinode_depoly, wire_format, inputs, batch_size)
+        mode = f"/batch x{batch_size}" if batch_size else "逐条"
+        print(f"{wire_format:<10}{mode:<14}{elapsed:>10.2f}{args.num_inputs / elapsed:>14.0f}{failed:>6}")
+
+    multinode_depoly.shut_down("bench_wire")
+
+
+if __name__ == "__main__":
+    main()
@@ -48,15 +48,11 @@ multinode_depoly.initialize_deployment(
     max_replicas=2,     # 最多副本数 
     task_processor=MyDeployment,  # 用户自定义任务API 
     num_gpus=1,
+    warmup_input="WARMUP",   # 副本启动后先预热一次再接收请求
 ) 
     
-# 在集群环境启动部署对象
-multinode_depoly.run(port=8100) 
-
-
-# 等待服务启动 
-import time 
-time.sleep(5) 
+# 在集群环境启动部署对象，等待所有副本就绪(最多 300 秒)并打印各副本冷启动耗时 
+multinode_depoly.run(port=8100, ready_timeout=300) 
 
 
 # 再次查看集群状态
@@ -65,7 +61,6 @@ multinode_depoly.check_cluster_status()
 
 # 单次推理 
 print(multinode_depoly.inference("SINGLE TASK")) 
-time.sleep(3)
     
 # 批量推理 
 input_data = ['BATCH TASK' + str(i) for i in range(50)] 
@@ -0,0 +1,88 @@
+import time
+from typing import Optional
+
+
+class AdaptiveBatchSizer:
+    """
+    自适应批大小：根据实测的批次延迟与吞吐动态调整 TaskManager 每批领取的任务数。
+
+    两种模式：
+    - 目标延迟：设置 target_latency 后，每个观测窗口按 size * target_latency / 实测平均延迟 调整，单次调整幅度不超过 2 倍；
+    - 吞吐爬山：未设置 target_latency 时，每个窗口比较当前批大小与上一次的吞吐(条/秒)，
+      吞吐提升则沿原方向继续乘/除步长，下降则反向并将步长减半(不小于 1.1)，最终收敛到峰值附近。
+
+    推理服务副本数变化时(如自动扩缩容)，批大小按副本数等比例缩放，并重新开始观测。
+
+    参数：
+    - initial_size (int): 初始批大小，默认 16；
+    - min_size / max_size (int): 批大小上下限，默认 1 / 1024；
+    - target_latency (float, 可选): 目标单批延迟(秒)；
+    - step (float): 吞吐爬山模式每次调整的倍数，默认 1.5；
+    - window (int): 每个批大小观测的批次数，默认 3。
+    """
+
+    def __init__(self, initial_size: int = 16, min_size: int = 1, max_size: int = 1024,
+                 target_latency: Optional[float] = None, step: float = 1.5, window: int = 3):
+        if not 1 <= min_size <= max_size:
+            raise ValueError("expected 1 <= min_size <= max_size")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.step = step
+        self.window = window
+
+        self._size = self._clamp(initial_size)
+        self._samples = []              # 当前窗口的 (条数, 延迟)
+        self._last_throughput = None    # 上一个窗口的吞吐
+        self._direction = 1             # 爬山方向，1 增大 / -1 减小
+        self._step = step               # 当前爬山步长，每次反向时减半
+        self._replicas = None
+        self.history = []               # [(时间, 批大小, 平均延迟, 吞吐)]，便于观察调整过程
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _clamp(self, size: float) -> int:
+        return max(self.min_size, min(self.max_size, int(round(size))))
+
+    def record(self, batch_size: int, latency: float):
+        """记录一个成功批次的条数与耗时(秒)，窗口满后调整批大小"""
+        if batch_size <= 0 or latency <= 0:
+            return
+        self._samples.append((batch_size, latency))
+        if len(self._samples) < self.window:
+            return
+
+        items = sum(n for n, _ in self._samples)
+        total_latency = sum(t for _, t in self._samples)
+        avg_latency = total_latency / len(self._samples)
+        throughput = items / total_latency
+        self._samples = []
+        self.history.append((time.time(), self._size, avg_latency, throughput))
+
+        if self.target_latency:
+            factor = max(0.5, min(2.0, self.target_latency / avg_latency))
+            self._size = self._clamp(self._size * factor)
+            return
+
+        if self._last_throughput is not None and throughput < self._last_throughput:
+            self._direction = -self._direction
+            self._step = max(1.1, 1 + (self._step - 1) / 2)
+        self._last_throughput = throughput
+        new_size = self._clamp(self._size * self._step if self._direction > 0 else self._size / self._step)
+        if new_size == self._size:
+            # 已到达边界，下次反向探测
+            self._direction = -self._direction
+        self._size = new_size
+
+    def update_replicas(self, num_replicas: int):
+        """推理服务副本数变化时按比例缩放批大小"""
+        if not num_replicas or num_replicas == self._replicas:
+            return
+        if self._replicas:
+            self._size = self._clamp(self._size * num_replicas / self._replicas)
+            self._samples = []
+            self._last_throughput = None
+            self._step = self.step
+        self._replicas = num_replicas
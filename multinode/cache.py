@@ -0,0 +1,112 @@
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+from .utils import payload_hash, UnhashablePayload
+
+# 缓存未命中标记，与结果为 None 区分
+MISSING = object()
+
+
+class ResultCache:
+    """
+    内容寻址的推理结果缓存，按 (命名空间, 输入内容) 的哈希索引结果。
+
+    - 进程内 LRU：条数超过 max_entries 时淘汰最久未使用的结果，设置 ttl 后过期结果视为未命中；
+    - 磁盘存储(可选)：指定 path 时结果同时写入 SQLite 文件，进程内未命中时回查磁盘，可跨进程/重启复用；
+      写入磁盘的结果需可 JSON 序列化，否则仅缓存在内存中。
+
+    命名空间用于隔离不同部署/模型版本的结果，MultiNodeDeployment 使用 "部署名:版本"。
+    无法按内容精确计算哈希的输入(见 payload_hash)没有缓存键，key() 返回 None，调用方应跳过缓存。
+
+    参数：
+    - max_entries (int): 进程内最多缓存的结果数，默认 10000；
+    - ttl (float, 可选): 结果有效期(秒)，缺省永不过期；
+    - path (str, 可选): 磁盘存储文件路径。
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: Optional[float] = None, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (过期时间, 结果)
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+            self._db.commit()
+
+    @staticmethod
+    def key(payload, namespace: str = "") -> Optional[str]:
+        try:
+            return payload_hash({"namespace": namespace, "input": payload})
+        except UnhashablePayload:
+            return None
+
+    def get(self, key: str):
+        """返回缓存的结果，未命中返回 MISSING"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT value, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None and (row[1] is None or row[1] > now):
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return MISSING
+
+    def put(self, key: str, value):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._remember(key, value, expires_at)
+            if self._db is not None:
+                try:
+                    data = json.dumps(value)
+                except (TypeError, ValueError):
+                    return
+                self._db.execute("INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                                 (key, data, expires_at))
+                self._db.commit()
+
+    def _remember(self, key: str, value, expires_at: Optional[float]):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,148 @@
+import time
+import asyncio
+import logging
+import threading
+from typing import Optional
+from .utils import lazy_import
+
+ray = lazy_import("ray")
+
+logger = logging.getLogger(__name__)
+
+
+class ClusterStatusCache:
+    """
+    集群状态快照缓存：一次刷新汇总节点、资源、Serve 应用与副本分布，在 ttl 内的查询直接返回快照，
+    避免频繁轮询(如看板、脚本中的状态检查)对头节点造成压力；Ray Client 模式下每次查询都是远程往返，收益更明显。
+
+    - snapshot(max_age)：快照超过 max_age(缺省 ttl) 时同步刷新，并发调用只触发一次刷新；
+    - asnapshot(max_age)：异步版本，在线程池中刷新，不阻塞事件循环；
+    - start(interval)：后台线程定期刷新，查询始终命中缓存；
+    - invalidate()：集群状态已知发生变化(如 MultiNodeDeployment 部署、关停应用)后丢弃快照。
+
+    参数：
+    - ttl (float): 快照有效期(秒)，默认 5。
+    """
+
+    def __init__(self, ttl: float = 5.0):
+        self.ttl = ttl
+        self._snapshot = None
+        self._lock = threading.Lock()           # 保证同一时刻只有一个刷新
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def age(self) -> float:
+        return time.time() - self._snapshot["timestamp"] if self._snapshot else float("inf")
+
+    def snapshot(self, max_age: Optional[float] = None) -> dict:
+        max_age = self.ttl if max_age is None else max_age
+        if self.age <= max_age:
+            return self._snapshot
+        with self._lock:
+            # 等锁期间其他线程可能已完成刷新
+            if self.age <= max_age:
+                return self._snapshot
+            self._snapshot = self._collect()
+            return self._snapshot
+
+    def refresh(self) -> dict:
+        return self.snapshot(max_age=0)
+
+    def invalidate(self):
+        """丢弃当前快照(如部署或关停应用后)，下次查询时重新获取"""
+        self._snapshot = None
+
+    async def asnapshot(self, max_age: Optional[float] = None) -> dict:
+        max_age = self.ttl if max_age is None else max_age
+        if self.age <= max_age:
+            return self._snapshot
+        return await asyncio.get_running_loop().run_in_executor(None, self.snapshot, max_age)
+
+    def start(self, interval: Optional[float] = None):
+        """启动后台刷新线程，interval 缺省为 ttl 的一半"""
+        if self._thread and self._thread.is_alive():
+            return
+        interval = interval or self.ttl / 2
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.warning(f"刷新集群状态失败: {e}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name="cluster-status", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _collect(self) -> dict:
+        nodes = ray.nodes()
+        resources = ray.cluster_resources()
+        available_resources = ray.available_resources()
+        try:
+            # 各节点可用资源，Ray Client 模式下不可用时仅提供各节点总资源
+            from ray._private.state import available_resources_per_node
+            available_per_node = available_resources_per_node()
+        except Exception:
+            available_per_node = {}
+        applications, replicas = _serve_status()
+
+        node_status = []
+        for node in nodes:
+            node_id = node["NodeID"]
+            total = node.get("Resources", {})
+            available = available_per_node.get(node_id)
+            node_ip = node["NodeManagerAddress"]
+            node_replicas = {}
+            for replica in replicas:
+                if replica["node_id"] == node_id:
+                    key = f"{replica['application']}/{replica['deployment']}"
+                    node_replicas[key] = node_replicas.get(key, 0) + 1
+            node_status.append({
+                "node_id": node_id,
+                "node_ip": node_ip,
+                "alive": node.get("Alive", True),
+                "is_head": bool(node.get("IsHead") or total.get("node:__internal_head__")),
+                "total": total,
+                "available": available,
+                "replicas": node_replicas,
+            })
+        return {
+            "timestamp": time.time(),
+            "nodes": node_status,
+            "resources": resources,
+            "available_resources": available_resources,
+            "applications": applications,
+            "replicas": replicas,
+        }
+
+
+def _serve_status():
+    """返回 (各应用状态, 副本列表)；Serve 未启动时均为空"""
+    from ray.serve.context import _get_global_client
+    from ray.serve.schema import ServeInstanceDetails
+    client = _get_global_client(raise_if_no_controller_running=False)
+    if client is None:
+        return {}, []
+    details = ServeInstanceDetails(**client.get_serve_details())
+    replicas = []
+    for app_name, application in details.applications.items():
+        for deployment_name, deployment in application.deployments.items():
+            for replica in deployment.replicas:
+                replicas.append({
+                    "application": app_name,
+                    "deployment": deployment_name,
+                    "replica_id": replica.replica_id,
+                    "state": str(replica.state.value if hasattr(replica.state, "value") else replica.state),
+                    "node_id": replica.node_id,
+                    "node_ip": replica.node_ip,
+                })
+    return details._get_status().applications, replicas
@@ -0,0 +1,49 @@
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/x-msgpack"
+
+# msgpack 扩展类型：NumPy 数组，数据为 msgpack([dtype, shape]) 头 + 原始内存
+_NDARRAY_EXT = 1
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError("binary wire format requires msgpack, please `pip install msgpack`")
+    return msgpack
+
+
+def _default(obj):
+    if hasattr(obj, "__array_interface__") and hasattr(obj, "dtype") and hasattr(obj, "tobytes"):
+        if obj.dtype.hasobject:
+            return obj.tolist()
+        header = _msgpack().packb([obj.dtype.str, list(obj.shape)])
+        return _msgpack().ExtType(_NDARRAY_EXT, len(header).to_bytes(4, "little") + header + obj.tobytes())
+    if hasattr(obj, "item") and hasattr(obj, "dtype"):
+        return obj.item()       # NumPy 标量
+    raise TypeError(f"cannot encode object of type {type(obj).__name__}")
+
+
+def _ext_hook(code: int, data: bytes):
+    if code == _NDARRAY_EXT:
+        import numpy as np
+        size = int.from_bytes(data[:4], "little")
+        dtype, shape = _msgpack().unpackb(data[4:4 + size])
+        return np.frombuffer(data, dtype=np.dtype(dtype), offset=4 + size).reshape(shape)
+    return _msgpack().ExtType(code, data)
+
+
+def encode(obj) -> bytes:
+    """
+    按 msgpack 编码，NumPy 数组以 dtype/shape 头 + 原始内存编码，不经过文本转换；bytes 原样保存
+    """
+    return _msgpack().packb(obj, default=_default, use_bin_type=True)
+
+
+def decode(data: bytes):
+    """解码 encode 的结果，数组解码为只读的 NumPy 数组(共享请求体内存，不复制)"""
+    return _msgpack().unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+
+def is_msgpack(content_type: str) -> bool:
+    return bool(content_type) and content_type.split(";")[0].strip().lower() == MSGPACK_CONTENT_TYPE
@@ -0,0 +1,419 @@
+import json
+import time
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import ray
+from ray import serve
+from starlette.requests import Request
+from starlette.responses import Response, JSONResponse, StreamingResponse
+from .utils import payload_hash, UnhashablePayload
+from .codec import encode, decode, is_msgpack, MSGPACK_CONTENT_TYPE
+from . import metrics
+from .profiling import ReplicaProfiler, profiled_method
+
+DEFAULT_MAX_BATCH_SIZE = 8
+
+
+async def read_http_input(request: Request):
+    """从 HTTP 请求体(JSON 或 msgpack)中取出推理输入：{"input": x} 取 x，其余原样返回，空请求体返回 None"""
+    body = await request.body()
+    if not body:
+        return None
+    binary = is_msgpack(request.headers.get("content-type"))
+    with metrics.timer("mn_serialization_seconds", side="replica", op="decode", format="msgpack" if binary else "json"):
+        data = decode(body) if binary else json.loads(body)
+    if isinstance(data, dict) and "input" in data:
+        return data["input"]
+    return data
+
+
+def wrap_task_processor(task_processor, batching: dict = None, single_flight: bool = False, warmup_input=None,
+                        profiling: dict = None, app=None):
+    """
+    根据部署选项生成包装后的任务类，在副本内为用户的 task_processor 增加额外能力。
+
+    参数:
+        task_processor (type): 用户自定义任务类。
+        batching (dict, 可选): 动态批处理配置，见 _with_batching。
+        single_flight (bool): 合并副本内相同输入的并发请求，见 _with_single_flight。
+        warmup_input (可选): 副本就绪前的预热输入，见 _with_warmup。
+        profiling (dict, 可选): 副本启动即开启的剖析参数，见 _with_profiling。
+        app (FastAPI, 可选): 任务类将交给 serve.ingress(app)，此时只记录冷启动耗时(及预热)；
+            ingress 类不能定义 __call__，HTTP 编解码、流式输出与请求级埋点等包装均不适用；FastAPI 路由调用的是注册时的原函数，
+            方法级剖析无法生效，不支持与 batching / single_flight / profiling 同时使用。
+    返回:
+        type: 可直接交给 serve.deployment 的任务类；任务类总会记录副本冷启动耗时，函数原样返回。
+    部署时的指标/追踪设置(metrics.configure)随任务类带到副本中，见 _with_metrics。
+    """
+    if not inspect.isclass(task_processor):
+        if batching or single_flight or warmup_input is not None or profiling:
+            raise ValueError("batching / single_flight / warmup_input / profiling require task_processor to be a class")
+        return task_processor
+    # 各层包装都会将 __call__ 替换为普通的异步方法，是否流式输出以用户的任务类为准
+    streaming = is_streaming(task_processor)
+    # 预热直接调用用户的方法，需在其他包装之前(最内层)
+    task_processor = _with_warmup(task_processor, warmup_input,
+                                  method=batching.get("method", "batch_call") if batching else None)
+    if app is not None:
+        if batching or single_flight or profiling:
+            raise ValueError("batching / single_flight / profiling is not supported together with a FastAPI app!")
+        return task_processor
+    # 剖析包装用户的方法，预热调用的是原方法，不计入剖析
+    task_processor = _with_profiling(task_processor, profiling)
+    if batching:
+        task_processor = _with_batching(task_processor, **batching)
+    elif streaming:
+        if single_flight:
+            raise ValueError("single_flight is not supported for streaming (generator) task processors")
+        task_processor = _with_streaming(task_processor)
+    # single-flight 在批处理之外，重复请求在进入批处理队列前即被合并
+    if single_flight:
+        task_processor = _with_single_flight(task_processor)
+    # HTTP 编解码在最外层，解码后的输入再经过上述各层；流式输出由 _with_streaming 自行解析输入
+    if not streaming:
+        task_processor = _with_http_codec(task_processor)
+    return _with_metrics(task_processor, metrics.settings(), batched=bool(batching), streaming=streaming)
+
+
+def is_streaming(task_processor) -> bool:
+    """任务类的 __call__ 是否为(异步)生成器，即流式输出"""
+    call = getattr(task_processor, "__call__", None) if inspect.isclass(task_processor) else task_processor
+    return inspect.isgeneratorfunction(call) or inspect.isasyncgenfunction(call)
+
+
+def _sse_message(data, event: str = None) -> str:
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _sse_stream(chunks):
+    # 按 Server-Sent Events 格式逐块发送，结束时发送 data: [DONE]，中途出错时发送 error 事件
+    try:
+        if inspect.isasyncgen(chunks):
+            async for chunk in chunks:
+                yield _sse_message(chunk)
+        else:
+            for chunk in chunks:
+                yield _sse_message(chunk)
+    except Exception as e:
+        yield _sse_message(f"{type(e).__name__}: {e}", event="error")
+        return
+    yield "data: [DONE]\n\n"
+
+
+async def _resolve(result):
+    return await result if inspect.isawaitable(result) else result
+
+
+def _sub_path(request: Request) -> str:
+    # 请求路径中路由前缀(root_path)之后的部分
+    path, root_path = request.url.path, request.scope.get("root_path", "")
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    return path.rstrip("/")
+
+
+def _deployment_name() -> str:
+    try:
+        return serve.get_replica_context().replica_id.deployment_id.name
+    except Exception:
+        return ""
+
+
+async def _request_key(input_data, args, kwargs) -> Optional[str]:
+    # 无法按内容精确计算哈希的请求返回 None，不参与合并
+    try:
+        if isinstance(input_data, Request):
+            # starlette 会缓存已读取的请求体，用户的 __call__ 仍可再次读取；请求体按原始字节计算哈希
+            body = await input_data.body()
+            return payload_hash({"method": input_data.method, "url": str(input_data.url),
+                                 "content_type": input_data.headers.get("content-type"), "body": body})
+        return payload_hash({"input": input_data, "args": args, "kwargs": kwargs})
+    except UnhashablePayload:
+        return None
+
+
+def _with_warmup(task_processor, warmup_input=None, method: str = None):
+    """
+    记录副本冷启动耗时(构造函数，通常即模型加载)，并可在副本就绪前用 warmup_input 调用一次任务类，
+    预热完成前构造函数不返回，Ray Serve 不会向该副本路由请求，扩容出的新副本同样生效。
+
+    参数:
+        warmup_input (可选): 预热输入，None 表示不预热；预热失败视为副本启动失败。
+        method (str, 可选): 批处理方法名，开启 batching 时以 [warmup_input] 调用该方法，否则调用 __call__。
+    """
+    user_call = getattr(task_processor, method) if method else getattr(task_processor, "__call__", None)
+    if warmup_input is not None and not callable(user_call):
+        raise ValueError(f"task_processor {task_processor.__name__} cannot be called for warmup")
+
+    class WarmTaskProcessor(task_processor):
+        def __init__(self, *args, **kwargs):
+            start = time.time()
+            # 显式调用任务类的构造函数：serve.ingress 会在 MRO 中混入需要 app 参数的 ASGI 包装类
+            task_processor.__init__(self, *args, **kwargs)
+            self._mn_started_at = start
+            self._mn_init_seconds = time.time() - start
+            self._mn_warmup_seconds = None
+            if warmup_input is not None:
+                start = time.time()
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    # 构造函数可能运行在副本的事件循环中，异步方法放到独立线程的事件循环里执行
+                    executor.submit(self._mn_warmup).result()
+                self._mn_warmup_seconds = time.time() - start
+
+        def _mn_warmup(self):
+            result = user_call(self, [warmup_input]) if method else user_call(self, warmup_input)
+            if inspect.isawaitable(result):
+                async def wait():
+                    return await result
+                result = asyncio.run(wait())
+            # 生成器需消费完才会真正执行
+            if inspect.isgenerator(result):
+                result = list(result)
+            elif inspect.isasyncgen(result):
+                async def drain():
+                    return [chunk async for chunk in result]
+                result = asyncio.run(drain())
+            return result
+
+        def _mn_replica_info(self) -> dict:
+            """副本信息：副本 ID、所在节点、构造与预热耗时(秒)"""
+            context = serve.get_replica_context()
+            return {
+                "replica_id": context.replica_id.unique_id,
+                "node_ip": ray.util.get_node_ip_address(),
+                "started_at": self._mn_started_at,
+                "init_seconds": self._mn_init_seconds,
+                "warmup_seconds": self._mn_warmup_seconds,
+            }
+
+    WarmTaskProcessor.__name__ = task_processor.__name__
+    WarmTaskProcessor.__qualname__ = task_processor.__qualname__
+    return WarmTaskProcessor
+
+
+def _with_profiling(task_processor, profiling: dict = None):
+    """
+    按需剖析(默认关闭)：包装任务类的 __call__ 与公开方法，并提供管理方法供 MultiNodeDeployment 远程开关剖析、
+    拉取各副本的结果(见 MultiNodeDeployment.start_profiling / fetch_profile)，无需重新部署调试版本。
+
+    参数:
+        profiling (dict, 可选): 副本构造与预热完成后即开启剖析，参数同 ReplicaProfiler.start，
+            如 {"mode": "cprofile", "sample_rate": 0.01}。
+    """
+    methods = {}
+    for klass in reversed(task_processor.__mro__[:-1]):
+        for attr, value in vars(klass).items():
+            if inspect.isfunction(value) and (attr == "__call__" or not attr.startswith("_")):
+                methods[attr] = value
+
+    class ProfiledTaskProcessor(task_processor):
+        def __init__(self, *args, **kwargs):
+            self._mn_profiler = ReplicaProfiler()
+            task_processor.__init__(self, *args, **kwargs)
+            if profiling:
+                self._mn_profiler.start(**profiling)
+
+        def _mn_replica_id(self) -> dict:
+            return {"replica_id": serve.get_replica_context().replica_id.unique_id,
+                    "node_ip": ray.util.get_node_ip_address()}
+
+        def _mn_start_profiling(self, **options) -> dict:
+            return dict(self._mn_replica_id(), started=self._mn_profiler.start(**options))
+
+        def _mn_stop_profiling(self) -> dict:
+            self._mn_profiler.stop()
+            return self._mn_replica_id()
+
+        def _mn_fetch_profile(self, top: int = 30, reset: bool = False) -> dict:
+            report = dict(self._mn_replica_id(), **self._mn_profiler.report(top))
+            if reset:
+                self._mn_profiler.reset()
+            return report
+
+    for attr, func in methods.items():
+        setattr(ProfiledTaskProcessor, attr, profiled_method(f"{task_processor.__name__}.{attr}", func))
+    ProfiledTaskProcessor.__name__ = task_processor.__name__
+    ProfiledTaskProcessor.__qualname__ = task_processor.__qualname__
+    return ProfiledTaskProcessor
+
+
+def _with_batching(task_processor, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, batch_wait_timeout: float = 0.01,
+                   method: str = "batch_call"):
+    """
+    动态批处理：副本将并发到达的单条请求(handle 或 HTTP)聚合成批，交给用户的批处理方法，并将结果逐条路由回各自的调用方。
+
+    参数:
+        max_batch_size (int): 单批最大请求数。
+        batch_wait_timeout (float): 凑批最长等待时间(秒)，超时后即使未满也立即执行。
+        method (str): 用户任务类上的批处理方法名，签名为 method(self, inputs: List) -> List，
+            可为同步或异步方法，返回结果数量与顺序需与输入一致。
+    """
+    if not inspect.isclass(task_processor):
+        raise ValueError("batching requires task_processor to be a class")
+    if not callable(getattr(task_processor, method, None)):
+        raise ValueError(f"task_processor {task_processor.__name__} has no batch method '{method}'")
+
+    class BatchedTaskProcessor(task_processor):
+        @serve.batch(max_batch_size=max_batch_size, batch_wait_timeout_s=batch_wait_timeout)
+        async def _mn_batch(self, items):
+            # items 为 [(输入, 入队时间)]，入队到开始执行之间即凑批等待
+            deployment = self.__dict__.setdefault("_mn_deployment", _deployment_name())
+            start = time.perf_counter()
+            if metrics.enabled():
+                for _, enqueued_at in items:
+                    metrics.observe("mn_replica_queue_seconds", start - enqueued_at, deployment=deployment, stage="batch")
+                metrics.observe("mn_replica_batch_size", len(items), deployment=deployment)
+            inputs = [input_data for input_data, _ in items]
+            with metrics.timer("mn_replica_execution_seconds", deployment=deployment):
+                results = getattr(self, method)(inputs)
+                if inspect.isawaitable(results):
+                    results = await results
+            results = list(results)
+            if len(results) != len(inputs):
+                raise ValueError(f"batch method '{method}' returned {len(results)} results for {len(inputs)} inputs")
+            return results
+
+        async def __call__(self, input_data=None, *args, **kwargs):
+            if isinstance(input_data, Request):
+                input_data = await read_http_input(input_data)
+            return await self._mn_batch((input_data, time.perf_counter()))
+
+    BatchedTaskProcessor.__name__ = task_processor.__name__
+    BatchedTaskProcessor.__qualname__ = task_processor.__qualname__
+    return BatchedTaskProcessor
+
+
+def _with_streaming(task_processor):
+    """
+    流式输出：__call__ 为(异步)生成器的任务类，handle 以 options(stream=True) 调用时逐块返回；
+    HTTP 请求的输入按 read_http_input 解析(JSON 或 msgpack)后交给 __call__，结果以 Server-Sent Events(text/event-stream)
+    逐块返回，每块一条 "data: <JSON>"，结束时发送 "data: [DONE]"；不支持 /batch 批量接口。
+    """
+    class StreamingTaskProcessor(task_processor):
+        async def __call__(self, input_data=None, *args, **kwargs):
+            if isinstance(input_data, Request):
+                if _sub_path(input_data) == "/batch":
+                    return JSONResponse({"error": "batch requests are not supported by streaming deployments"},
+                                        status_code=400)
+                chunks = super().__call__(await read_http_input(input_data), *args, **kwargs)
+                return StreamingResponse(_sse_stream(chunks), media_type="text/event-stream")
+            # 返回生成器对象，由 Serve 逐块发送给 stream=True 的调用方
+            return super().__call__(input_data, *args, **kwargs)
+
+    StreamingTaskProcessor.__name__ = task_processor.__name__
+    StreamingTaskProcessor.__qualname__ = task_processor.__qualname__
+    return StreamingTaskProcessor
+
+
+def _with_single_flight(task_processor):
+    """
+    Single-flight：副本内输入相同(按请求内容哈希)的并发请求只调用一次任务类，所有等待者共享同一结果或异常；
+    请求完成后即从在途表中移除，不缓存结果。合并仅在同一副本内生效；无法按内容精确计算哈希的输入(见 payload_hash)不合并。
+    """
+    if not inspect.isclass(task_processor):
+        raise ValueError("single_flight requires task_processor to be a class")
+
+    class SingleFlightTaskProcessor(task_processor):
+        async def __call__(self, input_data=None, *args, **kwargs):
+            inflight = self.__dict__.setdefault("_mn_inflight", {})     # 请求键 -> 共享调用的 Task
+            key = await _request_key(input_data, args, kwargs)
+            if key is None:
+                return await _resolve(super().__call__(input_data, *args, **kwargs))
+            task = inflight.get(key)
+            if task is None:
+                # 共享调用在独立的 Task 中执行，首个请求(leader)被取消(如客户端断开)时不会中断调用
+                task = asyncio.ensure_future(_resolve(super().__call__(input_data, *args, **kwargs)))
+                inflight[key] = task
+                task.add_done_callback(lambda done: _finish_flight(inflight, key, done))
+            # 单个等待者被取消时不影响其他等待者
+            return await asyncio.shield(task)
+
+    SingleFlightTaskProcessor.__name__ = task_processor.__name__
+    SingleFlightTaskProcessor.__qualname__ = task_processor.__qualname__
+    return SingleFlightTaskProcessor
+
+
+def _finish_flight(inflight: dict, key: str, task: asyncio.Task):
+    if inflight.get(key) is task:
+        inflight.pop(key)
+    if not task.cancelled():
+        # 等待者均已取消时取出异常，避免 "exception was never retrieved" 告警
+        task.exception()
+
+
+def _with_http_codec(task_processor):
+    """
+    HTTP 二进制格式与批量接口：
+    - Content-Type 为 application/x-msgpack 的请求按 msgpack 解码输入(NumPy 数组按原始内存传输)，结果同样以 msgpack 返回；
+    - 路由前缀下的 /batch 接口接收 {"inputs": [...]}(JSON 或 msgpack)，N 个输入在副本内并发调用任务类
+      (开启 batching 时自动凑批)，按输入顺序返回结果列表，出错的输入对应 {"error": 错误信息}。
+    其余 JSON 请求原样(Request 对象)交给任务类，与未包装时一致。
+    """
+    class CodecTaskProcessor(task_processor):
+        async def __call__(self, input_data=None, *args, **kwargs):
+            call = super().__call__
+            if not isinstance(input_data, Request):
+                return await _resolve(call(input_data, *args, **kwargs))
+            binary = is_msgpack(input_data.headers.get("content-type"))
+            is_batch = _sub_path(input_data) == "/batch"
+            if not binary and not is_batch:
+                return await _resolve(call(input_data, *args, **kwargs))
+
+            data = await read_http_input(input_data)
+            if is_batch:
+                if not isinstance(data, dict) or not isinstance(data.get("inputs"), list):
+                    return JSONResponse({"error": 'batch request body must be {"inputs": [...]}'}, status_code=400)
+                results = await asyncio.gather(*[_resolve(call(item)) for item in data["inputs"]],
+                                               return_exceptions=True)
+                result = [{"error": f"{type(r).__name__}: {r}"} if isinstance(r, Exception) else r for r in results]
+            else:
+                result = await _resolve(call(data, *args, **kwargs))
+            if binary:
+                with metrics.timer("mn_serialization_seconds", side="replica", op="encode", format="msgpack"):
+                    content = encode(result)
+                return Response(content=content, media_type=MSGPACK_CONTENT_TYPE)
+            return result
+
+    CodecTaskProcessor.__name__ = task_processor.__name__
+    CodecTaskProcessor.__qualname__ = task_processor.__qualname__
+    return CodecTaskProcessor
+
+
+def _with_metrics(task_processor, telemetry: dict, batched: bool = False, streaming: bool = False):
+    """
+    副本侧埋点(最外层)：副本构造时按部署时的设置开启指标/追踪，每个请求记录
+    - proxy 排队耗时：客户端发送(x-mn-sent-at 请求头)到副本收到的时间，仅 HTTP 请求；
+    - 执行耗时：任务类处理请求的时间，开启 batching 时改为按批统计，流式输出不统计；
+    - 追踪 span：HTTP 请求沿用客户端 traceparent 请求头中的 trace_id，并附带 Serve 的 request_id。
+    """
+    class MeteredTaskProcessor(task_processor):
+        def __init__(self, *args, **kwargs):
+            metrics.configure(**telemetry)
+            self._mn_deployment = _deployment_name()
+            super().__init__(*args, **kwargs)
+
+        async def __call__(self, input_data=None, *args, **kwargs):
+            call = super().__call__
+            if not metrics.enabled() and not metrics.tracing_enabled():
+                return await _resolve(call(input_data, *args, **kwargs))
+            traceparent = None
+            if isinstance(input_data, Request):
+                traceparent = input_data.headers.get(metrics.TRACEPARENT_HEADER)
+                sent_at = input_data.headers.get(metrics.SENT_AT_HEADER)
+                if sent_at:
+                    metrics.observe("mn_replica_queue_seconds", max(0.0, time.time() - float(sent_at)),
+                                    deployment=self._mn_deployment, stage="proxy")
+            request_id = serve.context._serve_request_context.get().request_id
+            with metrics.span("replica.call", traceparent=traceparent, deployment=self._mn_deployment,
+                              request_id=request_id):
+                if batched or streaming:
+                    return await _resolve(call(input_data, *args, **kwargs))
+                with metrics.timer("mn_replica_execution_seconds", deployment=self._mn_deployment):
+                    return await _resolve(call(input_data, *args, **kwargs))
+
+    MeteredTaskProcessor.__name__ = task_processor.__name__
+    MeteredTaskProcessor.__qualname__ = task_processor.__qualname__
+    return MeteredTaskProcessor
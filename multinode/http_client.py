@@ -0,0 +1,260 @@
+import time
+import json
+import random
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+from .codec import encode, decode, is_msgpack, JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE
+from .utils import lazy_import
+from . import metrics
+
+# HTTP 库在首次请求时才导入
+requests = lazy_import("requests")
+aiohttp = lazy_import("aiohttp")
+
+
+# 可重试的 HTTP 状态码：超时、限流、服务端错误
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class HttpClient:
+    """
+    推理服务 HTTP 客户端，封装同步与异步两条请求路径。
+
+    - 同步路径使用 requests.Session，复用 keep-alive 连接；
+    - 异步路径使用 aiohttp.ClientSession 共享连接池，并通过信号量限制并发；
+    - 失败请求按指数退避 + 随机抖动(full jitter)重试。
+
+    参数：
+    - max_concurrency (int): 异步批量请求的最大并发数，同时也是连接池大小，默认 64；
+    - timeout (float): 单次请求超时时间(秒)，默认 30；
+    - max_retries (int): 每个请求的最大尝试次数，默认 3；为 0 或 1 时只尝试一次、不重试；
+    - backoff_base (float): 退避基准时间(秒)，第 n 次重试最多等待 backoff_base * 2**n，默认 0.5；
+    - backoff_max (float): 单次退避等待上限(秒)，默认 10；
+    - wire_format (str): 请求/响应编码，"json"(默认) 或 "msgpack"。msgpack 为二进制格式，NumPy 数组按原始内存传输，
+      需服务端为 MultiNodeDeployment 部署的任务类(或自行处理 application/x-msgpack)，客户端需安装 msgpack。
+    """
+
+    def __init__(self, max_concurrency: int = 64, timeout: float = 30, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 10, wire_format: str = "json"):
+        if wire_format not in ("json", "msgpack"):
+            raise ValueError(f"unknown wire_format '{wire_format}', expected 'json' or 'msgpack'")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.wire_format = wire_format
+
+        self._session = None            # 同步 requests.Session，首次使用时创建
+        self._async_session = None      # 常驻 aiohttp.ClientSession，通过 open() 创建
+        self._async_loop = None         # 常驻会话所绑定的事件循环
+
+    def backoff_delay(self, attempt: int) -> float:
+        """第 attempt 次(从 0 开始)失败后的等待时间：[0, min(backoff_max, backoff_base * 2**attempt)] 内均匀随机"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _request_body(self, payload) -> dict:
+        # 按 wire_format 编码请求体，返回 post 的关键字参数；开启追踪/指标时附带 traceparent 与发送时间请求头
+        headers = metrics.propagation_headers()
+        with metrics.timer("mn_serialization_seconds", side="client", op="encode", format=self.wire_format):
+            if self.wire_format == "msgpack":
+                data, headers["Content-Type"] = encode(payload), MSGPACK_CONTENT_TYPE
+            else:
+                data, headers["Content-Type"] = json.dumps(payload), JSON_CONTENT_TYPE
+        return {"data": data, "headers": headers}
+
+    @staticmethod
+    def _observe(url: str, start: float, status):
+        # 以路由前缀区分部署，/batch 接口计入同一部署
+        path = urlsplit(url).path.strip("/")
+        if path.endswith("batch"):
+            path = path[:-len("batch")].rstrip("/")
+        metrics.observe("mn_client_request_seconds", time.perf_counter() - start, deployment=path,
+                        transport="http", outcome="ok" if status == 200 else "error")
+
+    @staticmethod
+    def _response_body(content_type: str, content: bytes):
+        if is_msgpack(content_type):
+            with metrics.timer("mn_serialization_seconds", side="client", op="decode", format="msgpack"):
+                return decode(content)
+        text = content.decode("utf-8", errors="replace")
+        try:
+            with metrics.timer("mn_serialization_seconds", side="client", op="decode", format="json"):
+                return json.loads(text)
+        except ValueError:
+            return text
+
+    # ---------------- 同步路径 ----------------
+    @property
+    def session(self) -> "requests.Session":
+        if self._session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    def post(self, url: str, payload, max_retries: int = None, timeout: float = None):
+        """
+        同步 POST 请求，失败按退避策略重试。
+
+        返回:
+            (status_code, body): 成功时 body 为解析后的 JSON；全部失败时返回最后一次的状态码(连接异常为 None)与错误信息。
+        """
+        start = time.perf_counter()
+        with metrics.span("client.http", url=url):
+            status, body = self._post(url, payload, self.max_retries if max_retries is None else max_retries,
+                                      self.timeout if timeout is None else timeout)
+        self._observe(url, start, status)
+        return status, body
+
+    def _post(self, url: str, payload, max_retries: int, timeout: float):
+        status, error = None, None
+        for attempt in range(max(1, max_retries)):
+            try:
+                response = self.session.post(url, timeout=timeout, **self._request_body(payload))
+                status = response.status_code
+                if status == 200:
+                    return status, self._response_body(response.headers.get("Content-Type"), response.content)
+                error = response.text
+                if status not in RETRY_STATUS_CODES:
+                    break
+            except requests.RequestException as e:
+                status, error = None, str(e)
+            if attempt < max_retries - 1:
+                time.sleep(self.backoff_delay(attempt))
+        return status, error
+
+    def stream_post(self, url: str, payload, max_retries: int = None, timeout: float = None):
+        """
+        同步 POST 请求并逐块产出 Server-Sent Events 响应中的数据(每条 data 按 JSON 解析)，收到 [DONE] 结束。
+
+        仅在收到响应前(连接失败或可重试状态码)按退避策略重试，开始产出后不再重试；
+        最终失败或服务端发送 error 事件时抛出 RuntimeError。
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        timeout = self.timeout if timeout is None else timeout
+        status, error = None, None
+        for attempt in range(max(1, max_retries)):
+            try:
+                body = self._request_body(payload)
+                body["headers"]["Accept"] = "text/event-stream"
+                response = self.session.post(url, timeout=timeout, stream=True, **body)
+                status = response.status_code
+                if status == 200:
+                    break
+                error = response.text
+                response.close()
+                if status not in RETRY_STATUS_CODES:
+                    raise RuntimeError(f"HTTP {status}: {error}")
+            except requests.RequestException as e:
+                status, error = None, str(e)
+            if attempt < max_retries - 1:
+                time.sleep(self.backoff_delay(attempt))
+        else:
+            raise RuntimeError(f"HTTP {status}: {error}")
+
+        with response:
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    event = None        # 空行为事件分隔
+                elif line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        return
+                    try:
+                        data = json.loads(data)
+                    except ValueError:
+                        pass
+                    if event == "error":
+                        raise RuntimeError(data)
+                    yield data
+
+    # ---------------- 异步路径 ----------------
+    def _new_async_session(self) -> "aiohttp.ClientSession":
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def open(self):
+        """在当前事件循环中创建常驻连接池，供多次批量调用复用；用完需调用 aclose()"""
+        await self.aclose()
+        self._async_session = self._new_async_session()
+        self._async_loop = asyncio.get_running_loop()
+
+    async def aclose(self):
+        if self._async_session is not None and not self._async_session.closed:
+            await self._async_session.close()
+        self._async_session = None
+        self._async_loop = None
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    @asynccontextmanager
+    async def _session_scope(self):
+        # 若已在当前事件循环中 open()，复用常驻连接池；否则为本次调用创建临时连接池，调用结束即关闭
+        if self._async_session is not None and not self._async_session.closed \
+                and self._async_loop is asyncio.get_running_loop():
+            yield self._async_session
+        else:
+            session = self._new_async_session()
+            try:
+                yield session
+            finally:
+                await session.close()
+
+    async def _apost(self, session: "aiohttp.ClientSession", semaphore: asyncio.Semaphore, url: str, payload,
+                     max_retries: int, timeout: "aiohttp.ClientTimeout"):
+        start = time.perf_counter()
+        with metrics.span("client.http", url=url):
+            status, body = await self._apost_retry(session, semaphore, url, payload, max_retries, timeout)
+        self._observe(url, start, status)
+        return status, body
+
+    async def _apost_retry(self, session: "aiohttp.ClientSession", semaphore: asyncio.Semaphore, url: str, payload,
+                           max_retries: int, timeout: "aiohttp.ClientTimeout"):
+        status, error = None, None
+        for attempt in range(max(1, max_retries)):
+            try:
+                async with semaphore:
+                    async with session.post(url, timeout=timeout, **self._request_body(payload)) as response:
+                        status = response.status
+                        if status == 200:
+                            return status, self._response_body(response.headers.get("Content-Type"),
+                                                               await response.read())
+                        error = await response.text()
+                if status not in RETRY_STATUS_CODES:
+                    break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status, error = None, str(e) or type(e).__name__
+            # 退避等待期间不占用并发名额
+            if attempt < max_retries - 1:
+                await asyncio.sleep(self.backoff_delay(attempt))
+        return status, error
+
+    async def apost(self, url: str, payload, max_retries: int = None, timeout: float = None):
+        """异步 POST 单个请求，返回值同 post()"""
+        results = await self.batch_post(url, [payload], max_retries=max_retries, timeout=timeout)
+        return results[0]
+
+    async def batch_post(self, url: str, payloads, max_retries: int = None, timeout: float = None,
+                         max_concurrency: int = None):
+        """
+        并发 POST 一批请求，至多 max_concurrency 个请求同时在途，结果顺序与 payloads 一致。
+
+        返回:
+            List[(status_code, body)]
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        request_timeout = aiohttp.ClientTimeout(total=self.timeout if timeout is None else timeout)
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+        async with self._session_scope() as session:
+            tasks = [self._apost(session, semaphore, url, payload, max_retries, request_timeout) for payload in payloads]
+            return await asyncio.gather(*tasks)
@@ -0,0 +1,131 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import List, Optional
+from .task_manager import TaskManager
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    def __init__(self, manager: TaskManager, weight: float, max_in_flight: Optional[int]):
+        self.manager = manager
+        self.weight = weight
+        self.max_in_flight = max_in_flight
+        self.vtime = 0.0            # 虚拟时间：累计占用的任务数 / 权重
+        self.waiters = deque()      # 等待推理名额的 (future, 批大小)
+        self.batches = 0
+        self.items = 0
+        self.wait_seconds = 0.0     # 等待推理名额的累计耗时
+
+
+class _JobGate:
+    # 交给 TaskManager 流水线的名额接口，每批推理前 acquire，完成后 release
+    def __init__(self, scheduler: "JobScheduler", job: _Job):
+        self.scheduler = scheduler
+        self.job = job
+
+    async def acquire(self, cost: int):
+        await self.scheduler._acquire(self.job, cost)
+
+    def release(self):
+        self.scheduler._release()
+
+
+class JobScheduler:
+    """
+    多作业公平调度：多个 TaskManager(各自的任务表)共用一个推理服务时，按权重公平分配推理并发。
+
+    - 全局至多 max_in_flight 个批次同时在推理服务上执行，各作业的批次在名额前排队；
+    - 名额空出时分配给虚拟时间最小的作业，作业每获得一次名额，虚拟时间增加 批大小 / 权重，
+      长期来看各作业推理的任务数与权重成正比(加权公平排队)；
+    - 空闲后重新有任务的作业从当前虚拟时钟开始计，不会因空闲期间"攒下"的额度长时间独占推理服务；
+    - 作业内部仍按任务优先级领取，作业间只按权重分配。
+
+    例如交互式补数作业 weight=4、批量重跑作业 weight=1，两者都有积压时约 80% 的推理并发用于补数，
+    补数作业跑完后批量作业独占全部并发。
+
+    参数：
+    - max_in_flight (int): 全局同时执行的批次数，默认 4；
+    - status_interval (float): 各作业打印进度的最小间隔(秒)，默认 5。
+    """
+
+    def __init__(self, max_in_flight: int = 4, status_interval: float = 5.0):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be >= 1")
+        self.max_in_flight = max_in_flight
+        self.status_interval = status_interval
+        self.jobs: List[_Job] = []
+        self._free = max_in_flight
+        self._vclock = 0.0
+
+    def add_job(self, manager: TaskManager, weight: float = 1.0, max_in_flight: Optional[int] = None) -> TaskManager:
+        """
+        添加作业。
+
+        参数：
+        - manager (TaskManager): 作业的任务管理器，已通过 load_tasks 加载任务；
+        - weight (float): 权重，默认 1；
+        - max_in_flight (int, 可选): 该作业已领取、在途(推理中或排队等待名额)的批次上限，缺省为全局上限的 2 倍，
+          使作业在名额空出时总有批次在排队，权重才能生效。
+        """
+        if weight <= 0:
+            raise ValueError("weight must be > 0")
+        self.jobs.append(_Job(manager, weight, max_in_flight))
+        return manager
+
+    def run(self) -> dict:
+        """运行全部作业直至各作业都没有可领取的任务，返回各作业的调度统计"""
+        return asyncio.run(self.arun())
+
+    async def arun(self) -> dict:
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            job.manager._run_pipeline(job.max_in_flight or 2 * self.max_in_flight, self.status_interval,
+                                      gate=_JobGate(self, job))
+            for job in self.jobs])
+        elapsed = time.perf_counter() - start
+        summary = {job.manager.task_name: {"weight": job.weight, "batches": job.batches, "items": job.items,
+                                           "wait_seconds": round(job.wait_seconds, 3)} for job in self.jobs}
+        lines = [f"作业调度完成，耗时 {elapsed:.1f}s:"]
+        for name, item in summary.items():
+            lines.append(f"  {name:<20} 权重 {item['weight']:<6} 推理 {item['items']} 条 / {item['batches']} 批  "
+                         f"等待 {item['wait_seconds']:.1f}s")
+        logger.info("\n".join(lines), extra={"event": "jobs_finished", "seconds": elapsed, "jobs": summary})
+        return summary
+
+    async def _acquire(self, job: _Job, cost: int):
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        job.waiters.append((future, cost))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()     # 已分配名额后才被取消，归还名额
+            raise
+        job.wait_seconds += time.perf_counter() - start
+
+    def _release(self):
+        self._free += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._free > 0:
+            waiting = [job for job in self.jobs if job.waiters]
+            if not waiting:
+                return
+            job = min(waiting, key=lambda job: job.vtime)
+            future, cost = job.waiters.popleft()
+            if future.done():       # 等待期间已取消
+                continue
+            # 虚拟开始时间不早于当前虚拟时钟，空闲的作业不累积额度
+            started = max(job.vtime, self._vclock)
+            self._vclock = started
+            job.vtime = started + cost / job.weight
+            job.batches += 1
+            job.items += cost
+            self._free -= 1
+            future.set_result(None)
@@ -0,0 +1,384 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from typing import Optional, Callable
+
+logger = logging.getLogger("multinode")
+trace_logger = logging.getLogger("multinode.trace")
+
+# 延迟直方图的默认分桶(秒)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# 通过 HTTP 传递给副本的请求头：W3C traceparent 与客户端发送时间(用于副本统计排队耗时)
+TRACEPARENT_HEADER = "traceparent"
+SENT_AT_HEADER = "x-mn-sent-at"
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+_settings = {
+    "metrics": _env_flag("MULTINODE_METRICS"),
+    "tracing": _env_flag("MULTINODE_TRACING"),
+    "json_logs": os.environ.get("MULTINODE_LOG_FORMAT", "").strip().lower() == "json",
+}
+
+
+# ---------------- 结构化日志 ----------------
+# LogRecord 自带的属性，其余属性即 extra 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出一行 JSON：时间、级别、logger、消息及 extra 传入的结构化字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {"ts": round(record.created, 6), "level": record.levelname, "logger": record.name,
+                "msg": record.getMessage()}
+        data.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _DefaultHandler(logging.StreamHandler):
+    # 用户未配置 logging 时输出到标准输出，保持原先 print 的使用体验；根 logger 配置了 handler 后交由其处理，避免重复输出
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    def emit(self, record):
+        if not logging.getLogger().handlers:
+            self.stream = sys.stdout        # 与 print 一致，跟随 sys.stdout 的重定向
+            super().emit(record)
+
+
+_default_handler = _DefaultHandler()
+_default_handler.setFormatter(JsonFormatter() if _settings["json_logs"] else logging.Formatter("%(message)s"))
+logger.addHandler(_default_handler)
+logger.setLevel(logging.INFO)
+
+
+# ---------------- 指标 ----------------
+class Metric:
+    """进程内计数器/直方图，按标签组合分别统计；Ray 已初始化时同步上报到 ray.util.metrics，由 Ray 以 Prometheus 格式导出"""
+
+    def __init__(self, name: str, kind: str, description: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.kind = kind
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) if kind == "histogram" else ()
+        self._values = {}           # 标签值 -> 计数，或 [各分桶计数..., 总和, 次数]
+        self._lock = threading.Lock()
+        self._ray_metric = None     # None: 尚未创建；False: 不可用(如 Ray 未初始化或 Ray Client 模式)
+
+    def record(self, value: float, labels: dict):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            if self.kind == "counter":
+                self._values[key] = self._values.get(key, 0) + value
+            else:
+                state = self._values.get(key)
+                if state is None:
+                    state = self._values[key] = [0] * (len(self.buckets) + 2)
+                for i, bound in enumerate(self.buckets):
+                    if value <= bound:
+                        state[i] += 1
+                state[-2] += value
+                state[-1] += 1
+        ray_metric = self._ray_metric if self._ray_metric is not None else self._create_ray_metric()
+        if ray_metric:
+            try:
+                tags = dict(zip(self.labels, key))
+                ray_metric.inc(value, tags) if self.kind == "counter" else ray_metric.observe(value, tags)
+            except Exception:
+                self._ray_metric = False
+
+    def _create_ray_metric(self):
+        self._ray_metric = False
+        try:
+            import ray
+            if ray.is_initialized():
+                from ray.util import metrics as ray_metrics
+                if self.kind == "counter":
+                    self._ray_metric = ray_metrics.Counter(self.name, self.description, tag_keys=self.labels)
+                else:
+                    self._ray_metric = ray_metrics.Histogram(self.name, self.description, boundaries=list(self.buckets),
+                                                             tag_keys=self.labels)
+        except Exception:
+            self._ray_metric = False
+        return self._ray_metric
+
+    def samples(self):
+        with self._lock:
+            return {key: (list(value) if isinstance(value, list) else value) for key, value in self._values.items()}
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+def _define(name: str, kind: str, description: str, labels=(), buckets=DEFAULT_BUCKETS) -> Metric:
+    REGISTRY[name] = Metric(name, kind, description, labels, buckets)
+    return REGISTRY[name]
+
+
+REGISTRY = {}
+_define("mn_client_request_seconds", "histogram", "客户端调用推理服务的耗时", ("deployment", "transport", "outcome"))
+_define("mn_serialization_seconds", "histogram", "HTTP 请求/响应编解码耗时", ("side", "op", "format"))
+_define("mn_replica_queue_seconds", "histogram",
+        "请求在副本执行前的排队耗时；proxy 为客户端发送至副本收到(含 Serve 代理排队，跨节点受时钟偏差影响)，batch 为批处理凑批等待",
+        ("deployment", "stage"))
+_define("mn_replica_execution_seconds", "histogram", "副本内任务类的执行耗时(批处理时为整批)",
+        ("deployment", "outcome"))
+_define("mn_replica_batch_size", "histogram", "副本内动态批处理的批大小", ("deployment",),
+        buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+_define("mn_task_db_seconds", "histogram", "TaskManager 存储操作耗时", ("task", "op", "outcome"))
+_define("mn_task_engine_seconds", "histogram", "TaskManager 单批推理耗时", ("task", "outcome"))
+_define("mn_tasks_total", "counter", "TaskManager 写回的任务数，按写回后的状态统计", ("task", "status"))
+
+
+def settings() -> dict:
+    """当前的指标/追踪/日志设置，可传给 configure 在其他进程(如副本)中复现"""
+    return dict(_settings)
+
+
+def configure(metrics: Optional[bool] = None, tracing: Optional[bool] = None, json_logs: Optional[bool] = None,
+              level: Optional[int] = None):
+    """
+    开关内置指标与追踪、设置日志格式。默认均关闭，关闭时各埋点仅为一次布尔判断。
+    也可通过环境变量 MULTINODE_METRICS=1、MULTINODE_TRACING=1、MULTINODE_LOG_FORMAT=json 开启；
+    部署时的设置会随任务类带到副本中。
+
+    参数：
+    - metrics (bool, 可选): 是否统计指标；
+    - tracing (bool, 可选): 是否记录请求级追踪 span(输出到 "multinode.trace" logger)；
+    - json_logs (bool, 可选): 默认日志 handler 是否输出 JSON 行；
+    - level (int, 可选): "multinode" logger 的日志级别。
+    """
+    if metrics is not None:
+        _settings["metrics"] = bool(metrics)
+    if tracing is not None:
+        _settings["tracing"] = bool(tracing)
+    if json_logs is not None:
+        _settings["json_logs"] = bool(json_logs)
+        _default_handler.setFormatter(JsonFormatter() if json_logs else logging.Formatter("%(message)s"))
+    if level is not None:
+        logger.setLevel(level)
+
+
+def enabled() -> bool:
+    return _settings["metrics"]
+
+
+def tracing_enabled() -> bool:
+    return _settings["tracing"]
+
+
+def observe(name: str, value: float, **labels):
+    if _settings["metrics"]:
+        REGISTRY[name].record(value, labels)
+
+
+def inc(name: str, value: float = 1, **labels):
+    if _settings["metrics"]:
+        REGISTRY[name].record(value, labels)
+
+
+class _NoopContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopContext()
+
+
+class _Timer:
+    def __init__(self, name: str, labels: dict, span_name: Optional[str]):
+        self.name = name
+        self.labels = labels
+        self.span = span(span_name, **labels) if span_name else _NOOP
+
+    def __enter__(self):
+        self.span.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        if _settings["metrics"]:
+            labels = self.labels
+            if "outcome" in REGISTRY[self.name].labels and "outcome" not in labels:
+                labels = dict(labels, outcome="error" if exc_type else "ok")
+            REGISTRY[self.name].record(elapsed, labels)
+        self.span.__exit__(exc_type, exc, tb)
+        return False
+
+
+def timer(name: str, span: Optional[str] = None, **labels):
+    """
+    统计代码块耗时到直方图 name，带 outcome 标签的指标按是否抛出异常区分 ok/error；
+    指定 span 时同时记录名为 span 的追踪 span。指标与追踪均关闭时返回共享的空上下文。
+    """
+    if not _settings["metrics"] and not (span and _settings["tracing"]):
+        return _NOOP
+    return _Timer(name, labels, span if _settings["tracing"] else None)
+
+
+def timed(func: Callable, name: str, **labels) -> Callable:
+    """返回统计 func 每次调用耗时的函数；指标关闭时原样返回 func"""
+    if not _settings["metrics"]:
+        return func
+
+    def wrapper(*args, **kwargs):
+        with _Timer(name, labels, None):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+# ---------------- 追踪 ----------------
+_current_span = contextvars.ContextVar("multinode_span", default=None)     # (trace_id, span_id)
+
+
+class _Span:
+    def __init__(self, name: str, attrs: dict, parent=None):
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+
+    def __enter__(self):
+        parent = self.parent or _current_span.get()
+        self.trace_id = parent[0] if parent else uuid.uuid4().hex
+        self.parent_id = parent[1] if parent else None
+        self.span_id = uuid.uuid4().hex[:16]
+        self.token = _current_span.set((self.trace_id, self.span_id))
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.time() - self.start
+        _current_span.reset(self.token)
+        trace_logger.info(f"span {self.name} {duration * 1000:.2f}ms", extra={
+            "event": "span", "span": self.name, "trace_id": self.trace_id, "span_id": self.span_id,
+            "parent_id": self.parent_id, "start": self.start, "duration_ms": duration * 1000,
+            "status": "error" if exc_type else "ok", "error": f"{exc_type.__name__}: {exc}" if exc_type else None,
+            **self.attrs})
+        return False
+
+
+def span(name: str, traceparent: Optional[str] = None, **attrs):
+    """
+    记录一个追踪 span(名称、trace_id/span_id/parent_id、起止时间、是否出错及 attrs)，结束时输出一条结构化日志；
+    同一协程/线程内嵌套的 span 自动成为子 span，traceparent 为上游通过 HTTP 传来的 W3C traceparent 头。
+    追踪关闭时返回共享的空上下文。
+    """
+    if not _settings["tracing"]:
+        return _NOOP
+    return _Span(name, attrs, _parse_traceparent(traceparent) if traceparent else None)
+
+
+def _parse_traceparent(value: str):
+    parts = value.split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None
+
+
+def propagation_headers() -> dict:
+    """发往副本的 HTTP 请求需附带的请求头：当前 span 的 traceparent 与发送时间；均关闭时为空"""
+    headers = {}
+    if _settings["tracing"]:
+        current = _current_span.get()
+        if current:
+            headers[TRACEPARENT_HEADER] = f"00-{current[0]}-{current[1]}-01"
+    if _settings["metrics"]:
+        headers[SENT_AT_HEADER] = repr(time.time())
+    return headers
+
+
+# ---------------- 导出 ----------------
+def _format_labels(names, values, extra: dict = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render() -> str:
+    """以 Prometheus 文本格式输出本进程的全部指标"""
+    lines = []
+    for metric in REGISTRY.values():
+        samples = metric.samples()
+        if not samples:
+            continue
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for key, value in samples.items():
+            if metric.kind == "counter":
+                lines.append(f"{metric.name}{_format_labels(metric.labels, key)} {value}")
+                continue
+            # 分桶计数在记录时已累计(值落入其上界不小于该值的全部分桶)
+            for bound, count in zip(metric.buckets, value):
+                lines.append(f"{metric.name}_bucket{_format_labels(metric.labels, key, {'le': bound})} {count}")
+            lines.append(f"{metric.name}_bucket{_format_labels(metric.labels, key, {'le': '+Inf'})} {value[-1]}")
+            lines.append(f"{metric.name}_sum{_format_labels(metric.labels, key)} {value[-2]}")
+            lines.append(f"{metric.name}_count{_format_labels(metric.labels, key)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> dict:
+    """本进程各直方图的次数/总耗时/均值与计数器取值，便于打印或写入日志"""
+    result = {}
+    for metric in REGISTRY.values():
+        for key, value in metric.samples().items():
+            name = metric.name + _format_labels(metric.labels, key)
+            if metric.kind == "counter":
+                result[name] = value
+            else:
+                result[name] = {"count": value[-1], "sum": value[-2], "mean": value[-2] / value[-1] if value[-1] else 0}
+    return result
+
+
+def reset():
+    for metric in REGISTRY.values():
+        metric.reset()
+
+
+def start_http_server(port: int = 9464, addr: str = "0.0.0.0"):
+    """
+    在后台线程启动 /metrics 接口，供 Prometheus 抓取本进程(如运行 TaskManager 的驱动进程)的指标；
+    副本内的指标经 ray.util.metrics 由 Ray 的指标端口导出。
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="multinode-metrics", daemon=True).start()
+    return server
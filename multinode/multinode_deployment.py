@@ -1,14 +1,35 @@
-import requests 
+import sys
+import time
+import uuid
 import asyncio 
-import ray 
-from ray import serve
-from ray.serve import Deployment 
-from ray.runtime_env import RuntimeEnv 
-from fastapi import FastAPI 
+import inspect
+import logging
+from typing import Callable, TYPE_CHECKING
+from .http_client import HttpClient
+from .cache import ResultCache, MISSING
+from .utils import payload_nbytes, lazy_import
+from .cluster_status import ClusterStatusCache
+from . import metrics
+
+if TYPE_CHECKING:
+    from ray.serve import Deployment
+    from ray.runtime_env import RuntimeEnv
+    from fastapi import FastAPI
+
+# ray / Serve 在首次使用时才导入，导入本模块与构造 MultiNodeDeployment(lazy=True) 不加载 ray
+ray = lazy_import("ray")
+serve = lazy_import("ray.serve")
+serve_api = lazy_import("ray.serve.api")
+
+logger = logging.getLogger(__name__)
+
+# batch_forward / batch_forward_iter 默认的在途请求上限，与 HttpClient 默认的 url 推理并发数一致
+DEFAULT_MAX_IN_FLIGHT = 64
  
 
 class MultiNodeDeployment:   
-    def __init__(self, ray_address: str = None): 
+    def __init__(self, ray_address: str = None, http_client: HttpClient = None, status_ttl: float = 5.0,
+                 lazy: bool = False, ship_package: bool = True, autoscaling_cluster: bool = False): 
         """ 
         完成连接 Ray 并查看集群状态 
         ray_address:  
@@ -16,68 +37,168 @@ class MultiNodeDeployment:
             "auto" -- 集群内自动发现并连接,自动发现并连接到同一网络内已存在的Ray集群,找不到抛出错误 
             "<head-node-ip>:<port>" - 集群内直接连接,需传入头节点ip和port 
             "ray://<head-node-ip>:10001" -- 集群外远程连接(Ray Client), 10001为头节点启动Ray Client服务默认监听端口
+        http_client: 
+            url 推理使用的 HTTP 客户端(连接池大小、并发上限、超时、重试退避)，缺省使用 HttpClient 默认配置
+        status_ttl: 
+            集群状态快照的有效期(秒)，有效期内 check_cluster_status 直接返回快照，默认 5 秒
+        lazy: 
+            为 True 时构造时不连接 Ray，首次定义部署、启动或查询服务时再连接(也可显式调用 connect)，
+            适合只做 url 推理或按需部署的脚本缩短启动时间
+        ship_package: 
+            连接 Ray 时是否将 multinode 包作为作业的 runtime_env py_modules 上传到集群，默认 True。 
+            副本中的包装层会引用 multinode 模块，开启后集群节点无需安装本包；集群节点仍需安装 requirements.txt 
+            中的依赖(使用 msgpack 格式时包括 msgpack)。连接前已由用户调用 ray.init 时不生效，需自行在 
+            runtime_env 中加入 py_modules 或在各节点安装本包 
+        autoscaling_cluster: 
+            集群是否配置了节点自动扩缩容(如 KubeRay、ray up 的 autoscaler)，默认 False。为 True 时部署前的资源检查 
+            只按当前节点告警、不拒绝部署，超出当前集群的副本由 autoscaler 扩容节点后启动 
         """ 
+        self.ray_address = ray_address
+        self.ship_package = ship_package
+        self.autoscaling_cluster = autoscaling_cluster
         self.cluster_config = {}
         self.deployment = None 
         self.deployment_handle = None
         self.deployment_name = None 
         self.head_node_ip = None
         self.url = None
-        self.check_cluster_status(ray_address, print_status=True)
+        self.replica_info = []          # run 就绪后各副本的冷启动耗时
+        self._replica_info_deployments = []     # 可获取副本信息(任务类)的部署名
+        self._profiled_names = []               # 可剖析(任务类，FastAPI 部署除外)的部署名
+        self.http_client = http_client or HttpClient()
+        self.cache = None               # 推理结果缓存，通过 enable_cache 开启
+        self.cache_version = ""
+        self.payload_ref_threshold = None   # 超过该字节数的输入经对象存储传递，通过 enable_payload_refs 开启
+        self.status_cache = ClusterStatusCache(ttl=status_ttl)
+        if not lazy:
+            self.connect()
         # if ray_address and ":" in ray_address:
         #     self.head_node_ip = ray_address.split(':')[-2].split('//')[-1]
      
-    def check_cluster_status(self, ray_address: str = None, print_status: bool = False): 
+    def connect(self):
         """ 
-        启动 Ray 并查看集群状态 
+        连接 Ray 并打印集群状态；已连接时直接返回。lazy 模式下由首次需要集群的操作自动调用 
+        """ 
+        if not self.cluster_config:
+            self.check_cluster_status(self.ray_address, print_status=True)
+
+    def check_cluster_status(self, ray_address: str = None, print_status: bool = False, max_age: float = None): 
+        """ 
+        启动 Ray 并查看集群状态。状态来自 status_cache 快照，快照未超过 max_age(缺省为 status_ttl)秒时不访问集群， 
+        max_age=0 强制刷新。 
  
         返回: 
-            dict: 包含节点信息、总资源情况以及可用资源的字典。 
+            dict: 包含节点信息、总资源情况以及可用资源的字典；nodes 为各节点的资源与副本分布。 
         """ 
         if not ray.is_initialized(): 
+            # 部署的任务类会引用 multinode 模块，随作业上传供副本导入
+            runtime_env = {"py_modules": [sys.modules[__package__]]} if self.ship_package else None
             if ray_address: 
-                ray.init(address=ray_address) 
+                ray.init(address=ray_address, runtime_env=runtime_env) 
             else: 
-                ray.init() 
-                
-        nodes = ray.nodes()
-        resources = ray.cluster_resources()
-        available_resources = ray.available_resources()
+                ray.init(runtime_env=runtime_env) 
+        return self._apply_status(self.status_cache.snapshot(max_age), print_status)
+
+    async def acheck_cluster_status(self, print_status: bool = False, max_age: float = None): 
+        """ 
+        check_cluster_status 的异步版本，需刷新快照时在线程池中查询集群，不阻塞事件循环 
+        """ 
+        self.connect()
+        return self._apply_status(await self.status_cache.asnapshot(max_age), print_status)
+
+    def start_status_refresher(self, interval: float = None): 
+        """ 
+        启动后台线程定期刷新集群状态快照(缺省每 status_ttl/2 秒)，之后的状态查询均直接命中快照 
+        """ 
+        self.status_cache.start(interval)
+
+    def _apply_status(self, snapshot: dict, print_status: bool = False): 
+        resources = snapshot["resources"]
+        available_resources = snapshot["available_resources"]
+        nodes = [node for node in snapshot["nodes"] if node["alive"]]
         
         self.cluster_config = { 
-            "num_machines": len(nodes), 
+            "num_machines": len(snapshot["nodes"]), 
             "num_gpus": resources.get('GPU', 0), 
             "num_cpus": resources.get('CPU', 0), 
             "available_gpus": available_resources.get('GPU', 0),
             "available_cpus": available_resources.get('CPU', 0), 
+            "resources": resources,
+            "node_resources": [node["total"] for node in nodes],
+            "nodes": snapshot["nodes"],
         }
 
         if not self.head_node_ip:
             for node in nodes:
-                if node.get("IsHead", None) or node['Resources'].get("node:__internal_head__", None):
-                    self.head_node_ip = node["NodeManagerAddress"].split(":")[0]
+                if node["is_head"]:
+                    self.head_node_ip = node["node_ip"].split(":")[0]
                     break
         if print_status:
-            print("\n╔════════════════════════════╗") 
-            print("║        🚀 集群状态         ║") 
-            print("╠════════════════════════════╣") 
-            print(f"║ 头节点IP: {self.head_node_ip:<16} ║") 
-            print(f"║ 节点总数: {len(nodes):<16} ║") 
-            print(f"║ CPU(总): {resources.get('CPU', 0):<17} ║") 
-            print(f"║ CPU(可用): {available_resources.get('CPU', 0):<15} ║")
-            print(f"║ GPU(总): {resources.get('GPU', 0):<17} ║") 
-            print(f"║ GPU(可用): {available_resources.get('GPU', 0):<15} ║")
-            print("╚════════════════════════════╝") 
+            lines = [
+                "\n╔════════════════════════════╗",
+                "║        🚀 集群状态         ║",
+                "╠════════════════════════════╣",
+                f"║ 头节点IP: {self.head_node_ip:<16} ║",
+                f"║ 节点总数: {len(snapshot['nodes']):<16} ║",
+                f"║ CPU(总): {resources.get('CPU', 0):<17} ║",
+                f"║ CPU(可用): {available_resources.get('CPU', 0):<15} ║",
+                f"║ GPU(总): {resources.get('GPU', 0):<17} ║",
+                f"║ GPU(可用): {available_resources.get('GPU', 0):<15} ║",
+                "╚════════════════════════════╝",
+            ]
+            for node in nodes:
+                usage = []
+                for key in ("CPU", "GPU"):
+                    total = node["total"].get(key, 0)
+                    if total:
+                        used = total - node["available"].get(key, 0) if node["available"] is not None else "?"
+                        usage.append(f"{key} {used}/{total}")
+                replicas = sum(node["replicas"].values())
+                lines.append(f"  {'*' if node['is_head'] else ' '} {node['node_ip']:<15} {'  '.join(usage)}  副本 {replicas}")
+            logger.info("\n".join(lines), extra={"event": "cluster_status", "head_node_ip": self.head_node_ip,
+                                                 "num_machines": len(nodes), "resources": resources,
+                                                 "available_resources": available_resources})
          
-        return self.cluster_config | {"aplications": serve.status().applications}
+        return self.cluster_config | {"aplications": snapshot["applications"]}
+
+    def num_replicas(self, name: str = None, deployment: str = None) -> int: 
+        """ 
+        返回应用当前处于 RUNNING 状态的副本数，name 缺省为当前部署；指定 deployment 时只统计应用内的该部署(如流水线的某一阶段)。 
+        流水线只统计各阶段的副本，不含只做转发的入口部署(与应用同名)，TaskManager 据此按推理副本数缩放批大小。 
+        """ 
+        self.connect()
+        name = name or self.deployment_name
+        application = serve.status().applications.get(name)
+        if not application:
+            return 0
+        deployments = application.deployments
+        if deployment is None and len(deployments) > 1:
+            deployments = {key: status for key, status in deployments.items() if key != name}
+        return sum(status.replica_states.get("RUNNING", 0) for key, status in deployments.items()
+                   if deployment is None or key == deployment)
     
     def initialize_deployment(self, name: str, 
                               task_processor,
                               min_replicas: int = 1,
                             max_replicas: int = 1, 
                            num_gpus: int = 0, num_cpus: int = 1,
-                           runtime_env: RuntimeEnv=None, 
-                           app: FastAPI = None) -> Deployment: 
+                           runtime_env: "RuntimeEnv" = None, 
+                           app: "FastAPI" = None,
+                           batching: dict = None,
+                           single_flight: bool = False,
+                           initial_replicas: int = None,
+                           target_ongoing_requests: float = None,
+                           upscale_delay_s: float = None,
+                           downscale_delay_s: float = None,
+                           autoscaling_config: dict = None,
+                           max_ongoing_requests: int = None,
+                           memory: int = None,
+                           resources: dict = None,
+                           placement_group_bundles: list = None,
+                           placement_group_strategy: str = None,
+                           max_replicas_per_node: int = None,
+                           warmup_input=None,
+                           profiling: dict = None) -> "Deployment": 
         """ 
         初始化部署任务对象 
  
@@ -86,55 +207,244 @@ class MultiNodeDeployment:
             min_replicas (int): 最小副本数，控制服务的最低资源分配。 
             max_replicas (int): 最大副本数，决定服务在负载高时可扩展的最大副本数。 
             task_processor (Callable): 任务处理管道，封装推理或计算逻辑的可调用对象。 
-            num_gpus (int, 可选): 每个副本所需的 GPU 数量，默认为 1。 
+            num_gpus (int, 可选): 每个副本所需的 GPU 数量，默认为 0。 
+            num_cpus (int, 可选): 每个副本所需的 CPU 数量，默认为 1。 
+            batching (dict, 可选): 服务端动态批处理配置，副本将并发到达的单条请求聚合成批后调用任务类的批处理方法， 
+                如 {"max_batch_size": 8, "batch_wait_timeout": 0.01, "method": "batch_call"}， 
+                其中 method 签名为 method(self, inputs: List) -> List。不支持与 app 同时使用。 
+            single_flight (bool): 合并同一副本内输入相同的并发请求，只调用一次 task_processor，所有请求共享结果， 
+                适合重复输入较多的突发流量；可合并的并发量受副本 max_ongoing_requests 限制。不支持与 app 同时使用。 
+
+            弹性伸缩(缺省沿用 Ray Serve 默认值): 
+            initial_replicas (int, 可选): 启动时的副本数，缺省为 min_replicas；预期上线即有流量时可直接拉起更多副本。 
+            target_ongoing_requests (float, 可选): 每个副本期望的在途请求数，超过即扩容，调小可让扩容更积极。 
+            upscale_delay_s / downscale_delay_s (float, 可选): 扩容 / 缩容前负载需持续的时间(秒)，调小扩容延迟以跟上流量突增。 
+            autoscaling_config (dict, 可选): 其余 Ray Serve autoscaling_config 字段，如 upscaling_factor、metrics_interval_s。 
+            max_ongoing_requests (int, 可选): 单个副本同时处理的请求上限，开启 batching 时缺省为 2 * max_batch_size。 
+
+            资源与放置: 
+            memory (int, 可选): 每个副本预留的内存(字节)。 
+            resources (dict, 可选): 每个副本所需的自定义资源，如 {"accelerator_type:A100": 1}。 
+            placement_group_bundles (list, 可选): 副本的资源束列表，如 [{"GPU": 1, "CPU": 1}] * 4， 
+                第一个资源束供副本自身使用，其余预留给副本内创建的 worker(如张量并行)。 
+            placement_group_strategy (str, 可选): 资源束的放置策略，"PACK" / "SPREAD" / "STRICT_PACK" / "STRICT_SPREAD"， 
+                需配合 placement_group_bundles 使用。 
+            max_replicas_per_node (int, 可选): 单节点最多的副本数，设为 1 可将副本打散到不同节点，避免集中在同一节点。 
+
+            预热: 
+            warmup_input (可选): 预热输入，每个副本(含扩容出的副本)构造完成后先用它调用一次任务类，预热完成才接收请求； 
+                开启 batching 时以 [warmup_input] 调用批处理方法。各副本的构造与预热耗时见 get_replica_info。 
+
+            剖析: 
+            profiling (dict, 可选): 副本启动后即开启剖析，参数同 start_profiling，如 {"mode": "cprofile", "sample_rate": 0.01}； 
+                缺省不开启，部署后仍可随时通过 start_profiling 开启。FastAPI 路由无法剖析，不支持与 app 同时使用。 
+
+        异常: 
+            ValueError: 集群资源不足以启动初始副本，或单个副本的资源需求超过任一节点时抛出； 
+                autoscaling_cluster=True 时当前集群资源不足只告警，副本等待 autoscaler 扩容节点。 
         """ 
         self.deployment_name = name 
         # if serve.get_deployment_handle(name):
         #     assert f"deployment {name} already exists!"
-        if min_replicas * num_gpus > self.cluster_config.get('num_gpus', 0): 
-            assert "Insufficient GPU resources!!" 
-        if min_replicas * num_cpus > self.cluster_config.get('num_cpus', 0): 
-            assert "Insufficient CPU resources!!" 
- 
-        # 定义 Ray Serve 部署类，内部封装 task_processor 的调用逻辑 
-        ray_actor_options = {"num_gpus": num_gpus} 
-        if runtime_env: 
-            ray_actor_options["runtime_env"] = runtime_env 
-        if not app:
-            serve_deployment = serve.deployment( 
-                name=name, 
-                ray_actor_options=ray_actor_options, 
-                autoscaling_config={ 
-                    "min_replicas": min_replicas, 
-                    "max_replicas": max_replicas, 
-                }, 
-            )(task_processor) 
-             
-        else: 
-            serve_deployment = serve.deployment( 
-                name=name, 
-                ray_actor_options=ray_actor_options, 
-                autoscaling_config={ 
-                    "min_replicas": min_replicas, 
-                    "max_replicas": max_replicas, 
-                }, 
-            )(serve.ingress(app)(task_processor)) 
+        # 任务类由包装层记录冷启动耗时，函数部署无副本信息
+        self._replica_info_deployments = [name] if inspect.isclass(task_processor) else []
+        self._profiled_names = list(self._replica_info_deployments) if app is None else []
+        serve_deployment = self._build_deployment(
+            name, task_processor, min_replicas=min_replicas, max_replicas=max_replicas, num_gpus=num_gpus,
+            num_cpus=num_cpus, runtime_env=runtime_env, app=app, batching=batching, single_flight=single_flight,
+            initial_replicas=initial_replicas, target_ongoing_requests=target_ongoing_requests,
+            upscale_delay_s=upscale_delay_s, downscale_delay_s=downscale_delay_s,
+            autoscaling_config=autoscaling_config, max_ongoing_requests=max_ongoing_requests, memory=memory,
+            resources=resources, placement_group_bundles=placement_group_bundles,
+            placement_group_strategy=placement_group_strategy, max_replicas_per_node=max_replicas_per_node,
+            warmup_input=warmup_input, profiling=profiling,
+        )
         
         # 将部署绑定任务对象 
         self.deployment = serve_deployment.bind() 
+
+    def initialize_pipeline(self, name: str, stages: dict, output: str = None, ingress_options: dict = None): 
+        """ 
+        将多个任务类组成流水线(DAG)，作为一个 Serve 应用部署，如 预处理 -> 向量化 -> 重排。 
+
+        每个阶段是应用内独立的部署，可单独配置副本数、资源与动态批处理；入口部署按依赖顺序通过 DeploymentHandle 
+        调用各阶段，上游结果以对象引用直接传给下游，阶段间无 HTTP 请求与客户端往返。部署后 run / inference / 
+        batch_forward / url 推理的用法与单个部署相同，输入为流水线输入，输出为输出阶段的结果。 
+
+        参数: 
+            name (str): 应用名称。 
+            stages (dict): 阶段名 -> 阶段配置，配置为 initialize_deployment 的参数(task_processor 必填，不支持 app)， 
+                另可用 inputs 指定上游阶段名列表，"input" 表示流水线输入，缺省为前一个阶段(第一个阶段缺省为流水线输入)。 
+                有多个上游的阶段按 inputs 顺序接收多个位置参数。例如: 
+                { 
+                    "preprocess": {"task_processor": Preprocess}, 
+                    "embed": {"task_processor": Embed, "num_gpus": 1, "batching": {"max_batch_size": 32}}, 
+                    "rerank": {"task_processor": Rerank, "inputs": ["preprocess", "embed"]}, 
+                } 
+            output (str, 可选): 输出阶段，缺省为最后一个阶段。 
+            ingress_options (dict, 可选): 入口部署的 serve.deployment 参数；入口只做转发，默认单副本、不占 CPU， 
+                并允许 1000 个在途请求。 
+        """ 
+        if name in stages:
+            raise ValueError(f"stage name '{name}' conflicts with the pipeline name!")
+        from .pipeline import PipelineIngress, resolve_pipeline
+        from .deployment_wrapper import _with_http_codec
+        graph, order, output = resolve_pipeline(stages, output)
+        reserved = {}       # 已规划阶段占用的资源，保证各阶段合计不超过集群资源
+        handles = {}
+        self._replica_info_deployments = []
+        for stage in order:
+            config = {key: value for key, value in stages[stage].items() if key != "inputs"}
+            if config.get("app"):
+                raise ValueError(f"stage '{stage}': FastAPI app is not supported in a pipeline!")
+            task_processor = config.pop("task_processor")
+            if inspect.isclass(task_processor):
+                self._replica_info_deployments.append(stage)
+            handles[stage] = self._build_deployment(stage, task_processor, reserved=reserved, **config).bind()
+        self._profiled_names = list(self._replica_info_deployments)
+
+        options = {"num_replicas": 1, "max_ongoing_requests": 1000, "ray_actor_options": {"num_cpus": 0}}
+        options.update(ingress_options or {})
+        # 入口同样经过 HTTP 编解码层，支持 msgpack 与 /batch 批量接口
+        ingress = serve.deployment(name=name, **options)(_with_http_codec(PipelineIngress))
+        self.deployment_name = name
+        self.deployment = ingress.bind(graph, order, output, handles)
+
+    def _build_deployment(self, name: str, task_processor,
+                          min_replicas: int = 1, max_replicas: int = 1, num_gpus: int = 0, num_cpus: int = 1,
+                          runtime_env: "RuntimeEnv" = None, app: "FastAPI" = None, batching: dict = None,
+                          single_flight: bool = False, initial_replicas: int = None,
+                          target_ongoing_requests: float = None, upscale_delay_s: float = None,
+                          downscale_delay_s: float = None, autoscaling_config: dict = None,
+                          max_ongoing_requests: int = None, memory: int = None, resources: dict = None,
+                          placement_group_bundles: list = None, placement_group_strategy: str = None,
+                          max_replicas_per_node: int = None, warmup_input=None, profiling: dict = None,
+                          reserved: dict = None) -> "Deployment":
+        """
+        生成单个 Ray Serve 部署(未绑定)，参数同 initialize_deployment；
+        reserved 为同一应用中其他部署已占用的资源，用于整体的资源检查，检查通过后累加本部署的占用
+        """
+        from .deployment_wrapper import wrap_task_processor, DEFAULT_MAX_BATCH_SIZE
+        if placement_group_strategy and not placement_group_bundles:
+            raise ValueError("placement_group_strategy requires placement_group_bundles!")
+        self.connect()      # 资源检查需要集群状态
+
+        # 定义 Ray Serve 部署类，内部封装 task_processor 的调用逻辑 
+        ray_actor_options = {"num_gpus": num_gpus, "num_cpus": num_cpus} 
+        if memory: 
+            ray_actor_options["memory"] = memory 
+        if resources: 
+            ray_actor_options["resources"] = resources 
+        if runtime_env: 
+            ray_actor_options["runtime_env"] = runtime_env 
+        self._check_resources(ray_actor_options, initial_replicas or min_replicas,
+                              placement_group_bundles, placement_group_strategy, max_replicas_per_node, reserved)
+
+        autoscaling = {"min_replicas": min_replicas, "max_replicas": max_replicas}
+        for key, value in (("initial_replicas", initial_replicas),
+                           ("target_ongoing_requests", target_ongoing_requests),
+                           ("upscale_delay_s", upscale_delay_s),
+                           ("downscale_delay_s", downscale_delay_s)):
+            if value is not None:
+                autoscaling[key] = value
+        autoscaling.update(autoscaling_config or {})
+
+        deployment_options = {}
+        task_processor = wrap_task_processor(task_processor, batching=batching, single_flight=single_flight,
+                                             warmup_input=warmup_input, profiling=profiling, app=app)
+        if batching:
+            # 副本并发上限需容纳一整批请求，并为下一批凑批留出余量
+            deployment_options["max_ongoing_requests"] = 2 * batching.get("max_batch_size", DEFAULT_MAX_BATCH_SIZE)
+        if max_ongoing_requests:
+            deployment_options["max_ongoing_requests"] = max_ongoing_requests
+        if placement_group_bundles:
+            deployment_options["placement_group_bundles"] = placement_group_bundles
+            deployment_options["placement_group_strategy"] = placement_group_strategy or "PACK"
+        if max_replicas_per_node:
+            deployment_options["max_replicas_per_node"] = max_replicas_per_node
+        if app:
+            task_processor = serve.ingress(app)(task_processor)
+        return serve.deployment( 
+            name=name, 
+            ray_actor_options=ray_actor_options, 
+            autoscaling_config=autoscaling, 
+            **deployment_options,
+        )(task_processor) 
+
+    def _check_resources(self, ray_actor_options: dict, num_replicas: int, placement_group_bundles: list = None,
+                         placement_group_strategy: str = None, max_replicas_per_node: int = None,
+                         reserved: dict = None):
+        """
+        部署前检查集群资源：初始副本的总需求(加上 reserved 中已占用的资源)不超过集群总资源，单个副本(或资源束)能放进某个节点；
+        集群配置了自动扩缩容(autoscaling_cluster)时，当前节点放不下只告警，由 autoscaler 扩容
+        """
+        def insufficient(message: str):
+            if not self.autoscaling_cluster:
+                raise ValueError(message)
+            logger.warning(f"{message} 集群已开启自动扩缩容，等待 autoscaler 扩容节点",
+                           extra={"event": "resources_pending_scale_up"})
+
+        actor = {"CPU": ray_actor_options.get("num_cpus", 1), "GPU": ray_actor_options.get("num_gpus", 0)}
+        if ray_actor_options.get("memory"):
+            actor["memory"] = ray_actor_options["memory"]
+        actor.update(ray_actor_options.get("resources") or {})
+        if placement_group_bundles:
+            bundles = placement_group_bundles
+            # 副本自身运行在第一个资源束中
+            for key, value in actor.items():
+                if value and bundles[0].get(key, 0) < value:
+                    raise ValueError(f"Replica requires {key}={value}, but the first bundle only has "
+                                     f"{bundles[0].get(key, 0)}!")
+        else:
+            bundles = [actor]
+        demand = {}
+        for bundle in bundles:
+            for key, value in bundle.items():
+                demand[key] = demand.get(key, 0) + value
+
+        total = self.cluster_config.get("resources", {})
+        reserved = reserved if reserved is not None else {}
+        for key, value in demand.items():
+            required = num_replicas * value + reserved.get(key, 0)
+            if value and required > total.get(key, 0):
+                insufficient(f"Insufficient {key} resources: {num_replicas} replicas require "
+                             f"{num_replicas * value}, cluster has {total.get(key, 0)}"
+                             + (f" ({reserved[key]} reserved by other deployments)!" if reserved.get(key) else "!"))
+
+        # STRICT_PACK 的所有资源束需放在同一节点，其余情况每个资源束至少能放进某个节点
+        nodes = self.cluster_config.get("node_resources", [])
+        to_place = [demand] if placement_group_strategy == "STRICT_PACK" else bundles
+        for bundle in to_place:
+            if nodes and not any(all(node.get(key, 0) >= value for key, value in bundle.items() if value)
+                                 for node in nodes):
+                insufficient(f"No single node can hold a replica requiring {bundle}!")
+        if placement_group_strategy == "STRICT_SPREAD" and len(bundles) > len(nodes):
+            insufficient(f"STRICT_SPREAD needs {len(bundles)} nodes, cluster has {len(nodes)}!")
+        if max_replicas_per_node and num_replicas > max_replicas_per_node * len(nodes):
+            insufficient(f"{num_replicas} replicas cannot fit on {len(nodes)} nodes "
+                         f"with max_replicas_per_node={max_replicas_per_node}!")
+        for key, value in demand.items():
+            reserved[key] = reserved.get(key, 0) + num_replicas * value
     
     def connect_to_serve(self, name: str):
+        self.connect()
+        self.deployment_name = name
         self.deployment_handle = serve.get_deployment_handle(deployment_name=name, app_name=name)
         if not self.deployment_handle:
             assert f"deployment {name} not found!"
  
-    def run(self, port: int = 8000, route_prefix: str = None): 
+    def run(self, port: int = 8000, route_prefix: str = None, wait_ready: bool = True, ready_timeout: float = None, 
+            report_replicas: bool = True): 
         """ 
         多节点启动已定义的部署任务 
  
         参数: 
             port (int): 服务监听的端口号。 
+            wait_ready (bool): 是否等待所有副本启动(含预热)完成后再返回，默认 True；为 False 时提交部署后立即返回。 
+            ready_timeout (float, 可选): 等待就绪的超时时间(秒)，缺省一直等待，超时抛出 TimeoutError。 
+            report_replicas (bool): 就绪后是否打印各副本的冷启动耗时，结果保存在 self.replica_info。 
         """ 
+        self.connect()
         route_prefix = route_prefix or f"/{self.deployment_name}"
         if not route_prefix.startswith("/"):
             route_prefix = f"/{route_prefix}"
@@ -142,7 +452,7 @@ class MultiNodeDeployment:
         if serve.context._global_client:
             current_port = serve.context._global_client._http_config.port
             if port != current_port:
-                print(f"Serve is already running on port {current_port} !")
+                logger.warning(f"Serve is already running on port {current_port} !")
                 port = current_port
                 # raise RuntimeError(
                 #     f"Serve is already running on port {current_port}. "
@@ -152,10 +462,219 @@ class MultiNodeDeployment:
         if not self.deployment: 
             raise ValueError("Empty deployment!") 
         serve.start(http_options={"port": port, "host": "0.0.0.0"}) 
-        self.deployment_handle = serve.run(self.deployment, name=self.deployment_name, route_prefix=route_prefix) 
+        # 非阻塞提交部署，就绪等待由 wait_until_ready 负责(支持超时)
+        self.deployment_handle = serve_api._run(self.deployment, name=self.deployment_name, route_prefix=route_prefix,
+                                                _blocking=False) 
         self.url = f"http://{self.head_node_ip}:{port}{route_prefix}" 
-        print(f"✅ 服务{self.deployment_name}已部署，访问地址：{self.url}")
+        self.replica_info = []
+        self.status_cache.invalidate()      # 应用列表已变化，下次查询集群状态时重新获取
+        if not wait_ready:
+            logger.info(f"✅ 服务{self.deployment_name}已提交部署，访问地址：{self.url}",
+                        extra={"event": "deployment_submitted", "deployment": self.deployment_name, "url": self.url})
+            return
+        elapsed = self.wait_until_ready(timeout=ready_timeout)
+        self.status_cache.invalidate()      # 副本已就绪，快照中的副本分布与可用资源已过期
+        logger.info(f"✅ 服务{self.deployment_name}已部署，耗时{elapsed:.1f}s，访问地址：{self.url}",
+                    extra={"event": "deployment_ready", "deployment": self.deployment_name, "url": self.url,
+                           "seconds": elapsed})
+        if report_replicas:
+            for deployment in self._replica_info_deployments:
+                self.replica_info.extend(self.get_replica_info(deployment=deployment, print_status=True))
+
+    def wait_until_ready(self, name: str = None, timeout: float = None, poll_interval: float = 0.5) -> float: 
+        """ 
+        等待应用进入 RUNNING 状态，即所有目标副本均已启动(含预热)并通过健康检查 
+
+        返回: 
+            float: 等待耗时(秒)。 
+        异常: 
+            RuntimeError: 部署失败(如构造函数或预热抛出异常)。 
+            TimeoutError: 超时仍未就绪。 
+        """ 
+        self.connect()
+        name = name or self.deployment_name
+        start = time.time()
+        while True:
+            application = serve.status().applications.get(name)
+            if application is not None:
+                if application.status == "RUNNING":
+                    return time.time() - start
+                if application.status == "DEPLOY_FAILED":
+                    raise RuntimeError(f"Deploying {name} failed: {application.message}")
+            if timeout is not None and time.time() - start > timeout:
+                status = application.status if application is not None else "NOT_STARTED"
+                raise TimeoutError(f"{name} is not ready after {timeout}s, current status: {status}")
+            time.sleep(poll_interval)
+
+    def get_replica_info(self, name: str = None, deployment: str = None, max_rounds: int = 10, 
+                         print_status: bool = False) -> list: 
+        """ 
+        获取各副本的 ID、所在节点、构造(模型加载)与预热耗时。 
+
+        请求由 Serve 路由到随机副本，这里每轮并发发出 2 倍副本数的查询，直到覆盖全部 RUNNING 副本或达到 max_rounds 轮。 
+        name 为应用名，deployment 为应用内的部署名(流水线阶段名)，缺省与应用同名。 
+        部署函数(而非任务类)时无法获取，返回空列表。 
+        """ 
+        deployment = deployment or name or self.deployment_name
+        try:
+            found = self._broadcast("_mn_replica_info", name=name, deployment=deployment, max_rounds=max_rounds)
+        except Exception as e:
+            logger.warning(f"无法获取副本信息: {e}")
+            return []
+        replicas = sorted(found, key=lambda info: info["started_at"])
+        if print_status:
+            expected = self.num_replicas(name, deployment)
+            lines = [f"{deployment} 副本冷启动耗时({len(replicas)}/{expected}):"]
+            for info in replicas:
+                warmup = f"{info['warmup_seconds']:.2f}s" if info["warmup_seconds"] is not None else "-"
+                lines.append(f"  {info['replica_id']:<10} 节点 {info['node_ip']:<15} 构造 {info['init_seconds']:.2f}s  预热 {warmup}")
+            logger.info("\n".join(lines), extra={"event": "replica_cold_start", "deployment": deployment,
+                                                 "replicas": replicas})
+        return replicas
      
+    def _broadcast(self, method_name: str, *args, name: str = None, deployment: str = None, max_rounds: int = 10,
+                   **kwargs) -> list:
+        # 在部署的每个副本上调用任务类的方法(返回含 replica_id 的 dict)。请求由 Serve 路由到随机副本，
+        # 每轮并发发出 2 倍副本数的调用，直到覆盖全部 RUNNING 副本或达到 max_rounds 轮；同一副本只保留首次结果
+        self.connect()
+        name = name or self.deployment_name
+        deployment = deployment or name
+        handle = serve.get_deployment_handle(deployment_name=deployment, app_name=name)
+        handle = handle.options(method_name=method_name)
+        expected = self.num_replicas(name, deployment)
+        found = {}
+        for _ in range(max_rounds):
+            responses = [handle.remote(*args, **kwargs) for _ in range(2 * max(expected, 1))]
+            for response in responses:
+                result = response.result()
+                result["deployment"] = deployment
+                found.setdefault(result["replica_id"], result)
+            if len(found) >= expected:
+                break
+        return list(found.values())
+
+    def _profiled_deployments(self, deployment: str = None) -> list:
+        deployments = [deployment] if deployment else self._profiled_names
+        if not deployments:
+            raise ValueError("profiling requires deployments created from a task processor class without a FastAPI app")
+        return deployments
+
+    def start_profiling(self, mode: str = "cprofile", sample_rate: float = 1.0, duration: float = None,
+                        interval: float = 0.01, name: str = None, deployment: str = None) -> list: 
+        """ 
+        在部署的各副本上开启剖析并清空上次结果，无需重新部署。 
+
+        参数: 
+            mode (str): "cprofile" 按 sample_rate 抽样请求(开启 batching 时为批次)用 cProfile 统计函数级耗时； 
+                "stack" 后台每 interval 秒采样一次副本内各线程的调用栈，开销与请求量无关。 
+                两种模式均统计任务类 __call__ 与各公开方法的耗时直方图。 
+            sample_rate (float): cprofile 模式下被剖析的请求比例，(0, 1]。 
+            duration (float, 可选): 剖析时长(秒)，到时各副本自动停止；缺省持续到 stop_profiling。 
+            interval (float): stack 模式的采样间隔(秒)。 
+            name (str, 可选): 应用名，缺省为当前部署。 
+            deployment (str, 可选): 应用内的部署名(流水线阶段名)，缺省为应用内全部任务类部署。 
+        返回: 
+            list: 已开启剖析的副本，[{"deployment", "replica_id", "node_ip", "started"}]。 
+        """ 
+        # 同一次开启使用同一 session，重复路由到同一副本时不会清空其已采集的结果
+        options = {"mode": mode, "sample_rate": sample_rate, "duration": duration, "interval": interval,
+                   "session": uuid.uuid4().hex}
+        return [replica for stage in self._profiled_deployments(deployment)
+                for replica in self._broadcast("_mn_start_profiling", name=name, deployment=stage, **options)]
+
+    def stop_profiling(self, name: str = None, deployment: str = None) -> list: 
+        """ 
+        停止各副本的剖析，已采集的结果保留，可继续 fetch_profile。 
+        """ 
+        return [replica for stage in self._profiled_deployments(deployment)
+                for replica in self._broadcast("_mn_stop_profiling", name=name, deployment=stage)]
+
+    def fetch_profile(self, top: int = 30, reset: bool = False, name: str = None, deployment: str = None, 
+                      print_status: bool = False) -> list: 
+        """ 
+        拉取各副本的剖析结果。 
+
+        参数: 
+            top (int): cprofile 文本与 stack 热点帧保留的条数。 
+            reset (bool): 拉取后清空副本上的结果(剖析继续进行)。 
+            print_status (bool): 是否输出各方法的耗时汇总与 cProfile 热点。 
+        返回: 
+            list: 每个副本一项，包含 deployment、replica_id、node_ip、mode、calls_seen、methods(方法名 -> 次数、 
+            均值与 p50/p95/p99/最大耗时(毫秒)、分桶计数)；cprofile 模式另含 cprofile_text 与原始统计 cprofile_stats， 
+            stack 模式另含 stacks(折叠栈 -> 采样次数)与 top_frames。可用 profiling.merge_cprofile / merge_stacks 
+            合并多个副本的结果，write_folded 写出火焰图输入。 
+        """ 
+        profiles = [profile for stage in self._profiled_deployments(deployment)
+                    for profile in self._broadcast("_mn_fetch_profile", top, reset, name=name, deployment=stage)]
+        if print_status:
+            for profile in profiles:
+                lines = [f"{profile['deployment']} 副本 {profile['replica_id']}({profile['node_ip']}) "
+                         f"{profile['mode'] or '未开启'}，顶层调用 {profile['calls_seen']} 次:"]
+                for method, summary in profile["methods"].items():
+                    if summary["count"]:
+                        lines.append(f"  {method:<30} {summary['count']:>8} 次  均值 {summary['mean_ms']:.2f}ms  "
+                                     f"p99 {summary['p99_ms']:.2f}ms")
+                if profile.get("cprofile_text"):
+                    lines.append(profile["cprofile_text"])
+                for frame, count in profile.get("top_frames", []):
+                    lines.append(f"  {count:>8}  {frame}")
+                logger.info("\n".join(lines), extra={"event": "replica_profile", "deployment": profile["deployment"],
+                                                     "replica_id": profile["replica_id"]})
+        return profiles
+
+    def enable_cache(self, cache: ResultCache = None, version: str = ""): 
+        """ 
+        开启推理结果缓存，命中时不再访问集群。inference / batch_forward / inference_url / batch_forward_url 均生效。 
+
+        参数: 
+            cache (ResultCache, 可选): 结果缓存，缺省创建进程内 LRU 缓存；多个部署对象可共享同一个缓存。 
+            version (str): 模型版本，与部署名一起组成缓存命名空间，更新模型后修改版本即可使旧结果失效。 
+        """ 
+        self.cache = cache or ResultCache()
+        self.cache_version = version
+        return self.cache
+
+    @property
+    def cache_namespace(self) -> str:
+        return f"{self.deployment_name}:{self.cache_version}"
+
+    def _cache_get(self, input_data):
+        if self.cache is None:
+            return None, MISSING
+        key = self.cache.key(input_data, self.cache_namespace)
+        if key is None:     # 无法按内容精确计算哈希的输入不走缓存
+            return None, MISSING
+        return key, self.cache.get(key)
+
+    def _cache_put(self, key, result):
+        if key is not None:
+            self.cache.put(key, result)
+
+    def enable_payload_refs(self, threshold: int = 1 << 20): 
+        """ 
+        开启大输入的对象存储传递：inference / inference_stream / batch_forward 中字节数不小于 threshold 的输入 
+        (NumPy 数组、张量、bytes、长文本)先 ray.put 写入对象存储一次，只将对象引用发给副本，由 Ray 在副本侧解析。 
+        同节点副本通过共享内存零拷贝读取(NumPy 数组为只读)，省去 handle 调用路径上的序列化与内存拷贝。 
+
+        参数: 
+            threshold (int): 字节数阈值，默认 1MB；传入 None 关闭。 
+        """ 
+        self.payload_ref_threshold = threshold
+
+    def _to_payload(self, input_data):
+        # 大输入写入对象存储，顶层参数中的 ObjectRef 会在副本侧自动解析为原对象
+        if self.payload_ref_threshold is None:
+            return input_data
+        nbytes = payload_nbytes(input_data)
+        if nbytes is not None and nbytes >= self.payload_ref_threshold:
+            return ray.put(input_data)
+        return input_data
+
+    def _timer(self, transport: str):
+        # handle 调用的耗时指标与追踪 span；HTTP 调用由 HttpClient 统计
+        return metrics.timer("mn_client_request_seconds", span=f"client.{transport}",
+                             deployment=self.deployment_name, transport=transport)
+
     def inference(self, input_data: str = None): 
         """ 
         通过DeploymentHandle进行同步推理 
@@ -163,56 +682,194 @@ class MultiNodeDeployment:
         if not self.deployment_handle:
             assert "Serve not found!"
         try: 
-            # 同步调用（适合单次请求） 
-            result = self.deployment_handle.remote(input_data).result() 
-            print("推理结果：", result) 
+            key, result = self._cache_get(input_data)
+            if result is MISSING:
+                # 同步调用（适合单次请求） 
+                with self._timer("handle"):
+                    result = self.deployment_handle.remote(self._to_payload(input_data)).result() 
+                self._cache_put(key, result)
+            logger.info(f"推理结果：{result}") 
             return result 
         except Exception as e: 
-            print(f"调用服务失败: {str(e)}") 
+            logger.error(f"调用服务失败: {str(e)}", extra={"event": "inference_failed", "deployment": self.deployment_name}) 
             return {"error": str(e)} 
  
-    async def batch_forward(self, input_list): 
+    async def inference_stream(self, input_data=None): 
+        """ 
+        通过 DeploymentHandle 进行流式推理，逐块产出任务类 __call__ (生成器)的输出，适合 LLM 逐 token 返回。 
+        流式结果不经过结果缓存。 
+
+        用法: 
+            async for chunk in multinode_depoly.inference_stream("prompt"): 
+                print(chunk, end="") 
+        """ 
+        if not self.deployment_handle:
+            raise RuntimeError("Serve not found!")
+        with self._timer("handle_stream"):
+            async for chunk in self.deployment_handle.options(stream=True).remote(self._to_payload(input_data)):
+                yield chunk
+
+    async def batch_forward(self, input_list, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT): 
         """ 
-        通过 DeploymentHandle 进行异步批量推理 
+        通过 DeploymentHandle 进行异步批量推理，至多 max_in_flight 个请求同时在途，结果顺序与输入一致 
+        """ 
+        return [result async for _, result in self.batch_forward_iter(input_list, max_in_flight=max_in_flight)]
+
+    async def batch_forward_iter(self, inputs, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, ordered: bool = True,
+                                 on_backpressure: Callable[[int], None] = None): 
         """ 
-        tasks = [self.deployment_handle.remote(data) for data in input_list]
-        return await asyncio.gather(*tasks)
+        通过 DeploymentHandle 进行流式批量推理，逐个产出 (输入下标, 结果)。 
+
+        输入可以是任意(同步或异步)可迭代对象，按需拉取，不会一次性展开；客户端同一时刻至多持有 
+        max_in_flight 个在途请求及待产出结果，内存占用与输入总量无关。开启缓存时命中的输入直接产出，不访问集群； 
+        开启 enable_payload_refs 时大输入经对象存储传递。 
+
+        参数: 
+            inputs (Iterable | AsyncIterable): 输入数据，可为生成器等惰性序列。 
+            max_in_flight (int): 在途请求上限；有序模式下已完成但尚未按序产出的结果也计入该上限。 
+            ordered (bool): True 按输入顺序产出；False 按完成先后产出。 
+            on_backpressure (Callable[[int], None], 可选): 窗口已满、暂停拉取新输入时回调，参数为当前占用数。 
+        """ 
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be >= 1")
+        if hasattr(inputs, "__aiter__"):
+            source = inputs.__aiter__()
+            async def next_input():
+                return await source.__anext__()
+        else:
+            source = iter(inputs)
+            async def next_input():
+                try:
+                    return next(source)
+                except StopIteration:
+                    raise StopAsyncIteration
+
+        loop = asyncio.get_running_loop()
+
+        def submit(data):
+            key, result = self._cache_get(data)
+            if result is not MISSING:
+                # 命中缓存，直接作为已完成的请求
+                future = loop.create_future()
+                future.set_result(result)
+                return future
+            return asyncio.ensure_future(call(key, data))
+
+        async def call(key, data):
+            with self._timer("handle"):
+                result = await self.deployment_handle.remote(self._to_payload(data))
+            self._cache_put(key, result)
+            return result
+
+        pending = {}        # 在途请求 task -> 输入下标
+        finished = {}       # 有序模式下已完成、等待按序产出的结果
+        next_index = 0      # 下一个待拉取的输入下标
+        next_yield = 0      # 有序模式下一个待产出的下标
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) + len(finished) < max_in_flight:
+                    try:
+                        data = await next_input()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    pending[submit(data)] = next_index
+                    next_index += 1
+                if not pending:
+                    break
+                if not exhausted and on_backpressure:
+                    on_backpressure(len(pending) + len(finished))
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = pending.pop(task)
+                    if ordered:
+                        finished[index] = task.result()
+                    else:
+                        yield index, task.result()
+                while next_yield in finished:
+                    yield next_yield, finished.pop(next_yield)
+                    next_yield += 1
+        finally:
+            # 调用方提前退出或出现异常时，取消剩余在途请求
+            for task in pending:
+                task.cancel()
      
-    def inference_url(self, input_data: str = None): 
+    def inference_url(self, input_data: str = None, timeout: float = None): 
         """ 
-        通过 url 进行同步推理 
+        通过 url 进行同步推理，复用 keep-alive 连接，失败按指数退避重试 
         """ 
-        url = self.url 
-        response = requests.post(url, json={"input": input_data}) 
-        if response.status_code == 200: 
-            print("推理结果：", response.json()) 
-            return response.json() 
+        key, body = self._cache_get(input_data)
+        if body is not MISSING:
+            logger.info(f"推理结果：{body}") 
+            return body 
+        status, body = self.http_client.post(self.url, {"input": input_data}, timeout=timeout) 
+        if status == 200: 
+            self._cache_put(key, body)
+            logger.info(f"推理结果：{body}") 
+            return body 
         else: 
-            print("调用服务失败，状态码：", response.status_code) 
+            logger.error(f"调用服务失败，状态码：{status} {body}", 
+                         extra={"event": "inference_failed", "deployment": self.deployment_name, "status": status}) 
      
-    async def batch_forward_url(self, input_list, max_retries=3): 
+    def inference_url_stream(self, input_data=None, timeout: float = None): 
+        """ 
+        通过 url 进行流式推理，服务端以 Server-Sent Events 逐块返回，本方法逐块产出(生成器)；出错时抛出 RuntimeError 
+        """ 
+        yield from self.http_client.stream_post(self.url, {"input": input_data}, timeout=timeout) 
+
+    async def batch_forward_url(self, input_list, max_retries: int = 3, max_concurrency: int = None,
+                                timeout: float = None, batch_size: int = None): 
         """ 
         通过 url 进行异步批量推理 
+
+        参数: 
+            max_retries (int): 每个请求的最大尝试次数，失败后按指数退避 + 随机抖动等待。 
+            max_concurrency (int, 可选): 同时在途的请求数上限，缺省使用 http_client.max_concurrency。 
+            timeout (float, 可选): 单次请求超时时间(秒)，缺省使用 http_client.timeout。 
+            batch_size (int, 可选): 指定后每 batch_size 个输入合并为一个请求，发往服务的 /batch 接口， 
+                减少请求数与逐条编解码开销；搭配 HttpClient(wire_format="msgpack") 可二进制传输数组。 
         """ 
-        url = self.url 
-        results = [] 
- 
-        async def request_with_retry(data, retries): 
-            for attempt in range(retries): 
-                response = requests.post(url, json={"input": data}) # 需改为异步 
-                if response.status_code == 200: 
-                    return response.json() 
-                await asyncio.sleep(1) 
-            return {"error": "请求失败"} 
- 
-        tasks = [request_with_retry(data, max_retries) for data in input_list] 
-        results = await asyncio.gather(*tasks) 
+        results, misses = [], []   # misses: 未命中缓存的 (下标, 缓存键, 输入)
+        for index, data in enumerate(input_list):
+            key, result = self._cache_get(data)
+            results.append(result)
+            if result is MISSING:
+                misses.append((index, key, data))
+
+        if batch_size:
+            chunks = [misses[i:i + batch_size] for i in range(0, len(misses), batch_size)]
+            responses = await self.http_client.batch_post(
+                f"{self.url.rstrip('/')}/batch", [{"inputs": [data for _, _, data in chunk]} for chunk in chunks],
+                max_retries=max_retries, timeout=timeout, max_concurrency=max_concurrency)
+            outcomes = []
+            for chunk, (status, body) in zip(chunks, responses):
+                if status == 200 and isinstance(body, list) and len(body) == len(chunk):
+                    outcomes.extend((status, item) for item in body)
+                else:
+                    outcomes.extend((None, None) for _ in chunk)
+        else:
+            outcomes = await self.http_client.batch_post(
+                self.url, [{"input": data} for _, _, data in misses],
+                max_retries=max_retries, timeout=timeout, max_concurrency=max_concurrency)
+
+        for (index, key, _), (status, body) in zip(misses, outcomes):
+            if status == 200:
+                # 批量接口中单个输入出错时返回 {"error": ...}，不写入缓存
+                if not (batch_size and isinstance(body, dict) and set(body) == {"error"}):
+                    self._cache_put(key, body)
+                results[index] = body
+            else:
+                results[index] = {"error": "请求失败"}
         return results 
  
     def shut_down(self, name: str = None): 
+        self.connect()
         if name:
             serve.delete(name)
         else:
             serve.shutdown()
+        self.status_cache.invalidate()
 
  
\ No newline at end of file
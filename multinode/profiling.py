@@ -0,0 +1,295 @@
+import os
+import sys
+import time
+import uuid
+import random
+import inspect
+import cProfile
+import pstats
+import threading
+import functools
+import contextvars
+from io import StringIO
+from collections import Counter
+from typing import Optional
+from .metrics import DEFAULT_BUCKETS
+
+PROFILE_MODES = ("cprofile", "stack")
+
+# 采样时视为空闲等待的栈顶帧(文件名, 函数名)，不计入调用栈统计；
+# 含阻塞在 C 代码中的 Ray worker 主循环、副本事件循环(uvloop)及线程入口
+_IDLE_FRAMES = {("selectors.py", "select"), ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+                ("threading.py", "run"), ("queue.py", "get"), ("thread.py", "_worker"), ("worker.py", "main_loop"),
+                ("replica.py", "_run_user_code_event_loop")}
+
+_call_depth = contextvars.ContextVar("multinode_profile_depth", default=0)
+
+
+class LatencyHistogram:
+    """按固定分桶统计的延迟直方图(秒)，分位数取所在分桶的上界"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # 最后一个为超出最大分桶的次数
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        rank, seen = p / 100 * self.count, 0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+            "buckets": {str(bound): count for bound, count in zip(self.buckets + ("+Inf",), self.counts) if count},
+        }
+
+
+class ReplicaProfiler:
+    """
+    副本内的性能剖析器，默认关闭，开启后：
+    - 统计任务类各方法(__call__ 与公开方法)每次调用的耗时直方图；
+    - cprofile 模式：按 sample_rate 抽样顶层调用(请求或批次)，在调用期间开启 cProfile，累计函数级耗时。
+      异步任务类在 await 期间同一事件循环上运行的其他请求也会计入，同一时刻只剖析一个调用；
+    - stack 模式：后台线程每 interval 秒采样一次副本内各线程的 Python 调用栈，按折叠栈(flamegraph 格式)计数，
+      不侵入请求路径，适合定位 CPU 热点与阻塞。
+    设置 duration 后到时自动停止，停止后统计结果保留，直至下次开启或 reset。
+    """
+
+    def __init__(self):
+        self.session = None
+        self.mode = None
+        self.active = False
+        self.sample_rate = 1.0
+        self.interval = 0.01
+        self.started_at = None
+        self.deadline = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self.reset()
+
+    def reset(self):
+        self.methods = {}                   # 方法名 -> LatencyHistogram
+        self.calls_seen = 0                 # 顶层调用数
+        self.calls_profiled = 0             # 被 cProfile 剖析的顶层调用数
+        self.stacks = Counter()             # 折叠栈 -> 采样次数
+        self.samples = 0
+        self._profile = cProfile.Profile()
+        self._profiling_call = False
+
+    def start(self, mode: str = "cprofile", sample_rate: float = 1.0, duration: Optional[float] = None,
+              interval: float = 0.01, session: Optional[str] = None) -> bool:
+        """开启剖析并清空上次结果；session 与正在进行的剖析相同时不重复开启，返回是否新开启"""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"unknown profile mode '{mode}', expected one of {PROFILE_MODES}")
+        if not 0 < sample_rate <= 1:
+            raise ValueError("sample_rate must be in (0, 1]")
+        with self._lock:
+            if session is not None and session == self.session and self.running:
+                return False
+            self._stop_locked()
+            self.reset()
+            self.session = session or uuid.uuid4().hex
+            self.mode = mode
+            self.sample_rate = sample_rate
+            self.interval = interval
+            self.started_at = time.time()
+            self.deadline = self.started_at + duration if duration else None
+            self.active = True
+            if mode == "stack":
+                self._stop.clear()
+                self._sampler = threading.Thread(target=self._sample_loop, name="multinode-profiler", daemon=True)
+                self._sampler.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            self._stop_locked()
+
+    def _stop_locked(self):
+        self.active = False
+        self._stop.set()
+        if self._sampler is not None and self._sampler is not threading.current_thread():
+            self._sampler.join()
+        self._sampler = None
+
+    @property
+    def running(self) -> bool:
+        if self.active and self.deadline is not None and time.time() >= self.deadline:
+            self.active = False     # 到时停止；采样线程自行退出
+        return self.active
+
+    def call(self, name: str):
+        """统计一次方法调用的上下文，调用方需先确认 running"""
+        return _ProfiledCall(self, name)
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval) and self.running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def report(self, top: int = 30) -> dict:
+        """汇总剖析结果：各方法耗时直方图，cprofile 模式附 pstats 文本与原始统计，stack 模式附折叠栈计数"""
+        result = {
+            "session": self.session,
+            "mode": self.mode,
+            "active": self.running,
+            "started_at": self.started_at,
+            "elapsed": (min(time.time(), self.deadline or time.time()) - self.started_at) if self.started_at else 0,
+            "calls_seen": self.calls_seen,
+            "methods": {name: histogram.summary() for name, histogram in self.methods.items()},
+        }
+        if self.mode == "cprofile":
+            self._profile.create_stats()
+            stats = self._profile.stats
+            result["calls_profiled"] = self.calls_profiled
+            result["cprofile_stats"] = stats
+            if stats:
+                output = StringIO()
+                pstats.Stats(_StatsData(stats), stream=output).sort_stats("cumulative").print_stats(top)
+                result["cprofile_text"] = output.getvalue()
+        elif self.mode == "stack":
+            leaves = Counter()
+            for stack, count in self.stacks.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+            result["samples"] = self.samples
+            result["stacks"] = dict(self.stacks)
+            result["top_frames"] = leaves.most_common(top)
+        return result
+
+
+class _ProfiledCall:
+    def __init__(self, profiler: ReplicaProfiler, name: str):
+        self.profiler = profiler
+        self.name = name
+        self.profiling = False
+
+    def __enter__(self):
+        profiler = self.profiler
+        self.top_level = _call_depth.get() == 0
+        self.token = _call_depth.set(_call_depth.get() + 1)
+        if self.top_level:
+            profiler.calls_seen += 1
+            if profiler.mode == "cprofile" and not profiler._profiling_call \
+                    and random.random() < profiler.sample_rate:
+                try:
+                    profiler._profile.enable()
+                    profiler._profiling_call = self.profiling = True
+                    profiler.calls_profiled += 1
+                except ValueError:
+                    pass    # 进程内已有其他 profiler 在运行(Python 3.12+ 不允许同时开启)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        if self.profiling:
+            self.profiler._profile.disable()
+            self.profiler._profiling_call = False
+        _call_depth.reset(self.token)
+        histogram = self.profiler.methods.get(self.name)
+        if histogram is None:
+            histogram = self.profiler.methods[self.name] = LatencyHistogram()
+        histogram.record(elapsed)
+        return False
+
+
+def profiled_method(name: str, func):
+    """包装任务类的方法：剖析开启时统计调用耗时，关闭时仅多一次属性判断；生成器方法原样返回"""
+    if inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func):
+        return func
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            profiler = self.__dict__.get("_mn_profiler")
+            if profiler is None or not profiler.running:
+                return await func(self, *args, **kwargs)
+            with profiler.call(name):
+                return await func(self, *args, **kwargs)
+    else:
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            profiler = self.__dict__.get("_mn_profiler")
+            if profiler is None or not profiler.running:
+                return func(self, *args, **kwargs)
+            with profiler.call(name):
+                return func(self, *args, **kwargs)
+    return wrapper
+
+
+class _StatsData:
+    # pstats.Stats 可从带 create_stats()/stats 的对象加载，用于从副本返回的原始统计构造 Stats
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def merge_cprofile(profiles) -> Optional[pstats.Stats]:
+    """合并多个副本 cprofile 模式的结果为一个 pstats.Stats，可 print_stats 或 dump_stats 保存后用 snakeviz 等查看"""
+    merged = None
+    for profile in profiles:
+        stats = profile.get("cprofile_stats")
+        if not stats:
+            continue
+        if merged is None:
+            merged = pstats.Stats(_StatsData(stats))
+        else:
+            merged.add(pstats.Stats(_StatsData(stats)))
+    return merged
+
+
+def merge_stacks(profiles) -> Counter:
+    """合并多个副本 stack 模式的折叠栈计数"""
+    merged = Counter()
+    for profile in profiles:
+        merged.update(profile.get("stacks") or {})
+    return merged
+
+
+def write_folded(stacks: Counter, path: str):
+    """按 "栈帧;栈帧;... 次数" 的折叠格式写入文件，可直接交给 flamegraph.pl / speedscope 生成火焰图"""
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
@@ -0,0 +1,226 @@
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import create_engine, event, inspect, insert, update, delete, select, text, func, bindparam, \
+    Index, Column, Integer, String, DateTime, JSON
+from sqlalchemy.ext.declarative import declarative_base
+from .task_store import TaskStatus, ClaimedTask, UPDATE_COLUMNS, TaskStore
+
+Base = declarative_base()
+
+# 任务数据模型
+# class TaskModel(Base):
+#     __tablename__ = 'tasks'
+#     task_id = Column(String, primary_key=True)        # 任务唯一 ID
+#     input_data = Column(JSON)                       # 输入数据
+#     status = Column(String, default=TaskStatus.PENDING)  # 当前状态，默认为待处理
+#     retries = Column(Integer, default=0)              # 重试次数
+#     result = Column(JSON)                           # 推理结果
+#     created_at = Column(DateTime, default=datetime.now)   # 创建时间
+#     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)  # 任务 完成/失败 时间
+
+_task_models = {}
+
+def create_task_model(table_name: str):
+    """根据指定表名动态创建 TaskModel 类，同一进程内同名表复用同一个模型"""
+    if table_name in _task_models:
+        return _task_models[table_name]
+
+    class TaskModel(Base):
+        __tablename__ = table_name
+        __table_args__ = (
+            # 回收租约过期的处理中任务
+            Index(f"ix_{table_name}_status_lease", "status", "lease_expires_at"),
+        )
+        task_id = Column(String, primary_key=True)
+        input_data = Column(JSON)
+        status = Column(String, default=TaskStatus.PENDING)
+        retries = Column(Integer, default=0)
+        result = Column(JSON)
+        error = Column(String)                       # 最近一次失败的错误信息
+        input_hash = Column(String, index=True)      # 输入内容哈希，用于去重
+        worker_id = Column(String)                   # 领取该任务的 worker
+        lease_expires_at = Column(DateTime)          # 租约到期时间，到期未续约的处理中任务可被其他 worker 回收
+        available_at = Column(DateTime)              # 失败重试的退避截止时间，此前不会被领取
+        priority = Column(Integer, default=0, server_default="0")    # 优先级，越大越先领取
+        deadline = Column(DateTime)                  # 截止时间，过期未完成的任务不再推理、直接标记为失败
+        created_at = Column(DateTime, default=datetime.now)
+        updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    table = TaskModel.__table__
+    # 领取(按优先级降序、同优先级按创建顺序)与状态统计(GROUP BY status)均走该索引，领取无需额外排序
+    Index(f"ix_{table_name}_claim", table.c.status, table.c.priority.desc(), table.c.created_at)
+    _task_models[table_name] = TaskModel
+    return TaskModel
+
+def migrate_task_table(engine, task_model):
+    """为已存在的旧版任务表补齐新增的列与索引(SQLite 的 create_all 不会修改已存在的表)"""
+    table = task_model.__table__
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                default = f" DEFAULT {column.server_default.arg}" if column.server_default is not None else ""
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}{default}'))
+    for index in table.indexes:
+        index.create(engine, checkfirst=True)
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    基于 SQLAlchemy Core 的任务存储，针对 SQLite 多进程并发访问做了调优：
+
+    - WAL 日志模式 + synchronous=NORMAL，读写互不阻塞，提交无需每次 fsync 主库文件；
+    - busy_timeout 等待写锁，多个 worker 争用时排队而不是直接报错；
+    - 领取任务使用单条 UPDATE ... WHERE task_id IN (SELECT ... LIMIT n) RETURNING，原子完成"查询+标记"，
+      候选任务按 (status, priority DESC, created_at) 索引顺序读取；
+    - 插入与状态更新均按批在单个事务内 executemany。
+
+    参数：
+    - db_url (str): 数据库连接字符串，默认 sqlite:///data/test.db，SQLite 文件所在目录不存在时自动创建；
+    - table_name (str): 任务表名；
+    - busy_timeout (float): 等待写锁的超时时间(秒)，默认 30。
+    """
+
+    def __init__(self, db_url: str, table_name: str, busy_timeout: float = 30):
+        self.db_url = db_url
+        self.engine = create_engine(db_url)
+        if self.engine.dialect.name == "sqlite":
+            database = self.engine.url.database
+            if database and database != ":memory:" and os.path.dirname(database):
+                os.makedirs(os.path.dirname(database), exist_ok=True)
+
+            @event.listens_for(self.engine, "connect")
+            def _tune_sqlite(dbapi_conn, _):
+                cursor = dbapi_conn.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+                cursor.close()
+
+        self.task_model = create_task_model(table_name)
+        self.table = self.task_model.__table__
+        Base.metadata.create_all(self.engine, tables=[self.table])     # 创建表结构
+        migrate_task_table(self.engine, self.task_model)                # 补齐旧表缺失的列与索引
+
+    def insert(self, rows: List[dict]):
+        if rows:
+            with self.engine.begin() as conn:
+                conn.execute(insert(self.table), rows)
+
+    def existing_hashes(self, hashes: List[str]) -> set:
+        existing = set()
+        with self.engine.connect() as conn:
+            for i in range(0, len(hashes), 500):
+                existing.update(conn.scalars(
+                    select(self.table.c.input_hash).where(self.table.c.input_hash.in_(hashes[i:i + 500]))))
+        return existing
+
+    def clear(self):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table))
+
+    def claim(self, limit: int, worker_id: str, lease_seconds: float) -> List[ClaimedTask]:
+        table = self.table
+        now = datetime.now()
+        # 回收租约过期的处理中任务(没有租约的视为已过期，兼容旧版本遗留的处理中任务)
+        expired = update(table).where(table.c.status == TaskStatus.PROCESSING) \
+            .where((table.c.lease_expires_at < now) | (table.c.lease_expires_at.is_(None))) \
+            .values(status=TaskStatus.PENDING, worker_id=None, lease_expires_at=None)
+        candidates = select(table.c.task_id).where(table.c.status == TaskStatus.PENDING) \
+            .where((table.c.available_at.is_(None)) | (table.c.available_at <= now)) \
+            .order_by(table.c.priority.desc(), table.c.created_at).limit(limit).scalar_subquery()
+        query = update(table).where(table.c.task_id.in_(candidates)) \
+            .values(status=TaskStatus.PROCESSING, worker_id=worker_id,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds), updated_at=now) \
+            .returning(table.c.task_id, table.c.input_data, table.c.retries, table.c.deadline, table.c.priority,
+                       table.c.created_at)
+        # 回收与领取在同一事务内完成
+        with self.engine.begin() as conn:
+            conn.execute(expired)
+            rows = conn.execute(query).all()
+        # RETURNING 不保证顺序，按优先级与创建时间恢复领取顺序
+        rows.sort(key=lambda row: (-(row.priority or 0), row.created_at))
+        return [ClaimedTask(row.task_id, row.input_data, row.retries, row.deadline) for row in rows]
+
+    def next_available_at(self) -> Optional[datetime]:
+        table = self.table
+        with self.engine.connect() as conn:
+            return conn.scalar(select(func.min(table.c.available_at)).where(table.c.status == TaskStatus.PENDING)
+                               .where(table.c.available_at > datetime.now()))
+
+    def heartbeat(self, task_ids: List[str], worker_id: str, lease_seconds: float) -> int:
+        table = self.table
+        renewed = 0
+        lease_expires_at = datetime.now() + timedelta(seconds=lease_seconds)
+        with self.engine.begin() as conn:
+            for i in range(0, len(task_ids), 500):
+                renewed += conn.execute(
+                    update(table).where(table.c.task_id.in_(task_ids[i:i + 500]))
+                    .where(table.c.worker_id == worker_id).where(table.c.status == TaskStatus.PROCESSING)
+                    .values(lease_expires_at=lease_expires_at)).rowcount
+        return renewed
+
+    def write_partials(self, results: dict, worker_id: str) -> int:
+        if not results:
+            return 0
+        table = self.table
+        query = update(table).where(table.c.task_id == bindparam("_task_id")) \
+            .where(table.c.worker_id == worker_id).where(table.c.status == TaskStatus.PROCESSING) \
+            .values(result=bindparam("result"), updated_at=datetime.now())
+        with self.engine.begin() as conn:
+            return conn.execute(query, [{"_task_id": task_id, "result": result}
+                                        for task_id, result in results.items()]).rowcount
+
+    def update(self, updates: List[dict], worker_id: Optional[str] = None):
+        if not updates:
+            return
+        now = datetime.now()
+        query = update(self.table).where(self.table.c.task_id == bindparam("_task_id"))
+        if worker_id is not None:
+            query = query.where(self.table.c.worker_id == worker_id) \
+                .where(self.table.c.status == TaskStatus.PROCESSING)
+        query = query.values(worker_id=None, lease_expires_at=None, updated_at=now,
+                             **{name: bindparam(name) for name in UPDATE_COLUMNS})
+        params = [dict({name: u.get(name) for name in UPDATE_COLUMNS}, _task_id=u["task_id"]) for u in updates]
+        with self.engine.begin() as conn:
+            conn.execute(query, params)
+
+    def count_by_status(self) -> dict:
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(self.table.c.status, func.count()).group_by(self.table.c.status))
+            return {status: n for status, n in rows}
+
+    def get_result(self, task_id: str):
+        with self.engine.connect() as conn:
+            return conn.scalar(select(self.table.c.result).where(self.table.c.task_id == task_id))
+
+    def iter_rows(self, columns: List[str], page_size: int = 1000, status: Optional[str] = None,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None):
+        table = self.table
+        conditions = []
+        if status is not None:
+            conditions.append(table.c.status == status)
+        if since is not None:
+            conditions.append(table.c.updated_at >= since)
+        if until is not None:
+            conditions.append(table.c.updated_at < until)
+
+        last_key = None
+        while True:
+            query = select(table.c.task_id, *[table.c[name] for name in columns]).where(*conditions)
+            if last_key is not None:
+                query = query.where(table.c.task_id > last_key)
+            query = query.order_by(table.c.task_id).limit(page_size)
+            # 每页使用独立连接，页与页之间不持有读事务
+            with self.engine.connect() as conn:
+                rows = conn.execute(query).all()
+            for row in rows:
+                yield dict(zip(columns, row[1:]))
+            if len(rows) < page_size:
+                return
+            last_key = rows[-1][0]
+
+    def close(self):
+        self.engine.dispose()
@@ -1,47 +1,122 @@
 import os
+import csv
+import logging
+import socket
 import json
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
-from typing import List, Optional, Callable
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, JSON
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Callable, Union
+from .utils import payload_hash, UnhashablePayload
+from .batch_sizer import AdaptiveBatchSizer
+from .cache import ResultCache, MISSING
+from . import metrics
+from .task_store import TaskStatus, TASK_COLUMNS, ClaimedTask, TaskStore, MemoryTaskStore
 # from multinode_deployment import MultiNodeDeployment
 
-Base = declarative_base()
 DB_URL = "sqlite:///data/test.db"
 
-# 任务状态定义类
-class TaskStatus:
-    PENDING = 'pending'         # 待处理
-    PROCESSING = 'processing'   # 处理中
-    COMPLETED = 'completed'     # 已完成
-    FAILED = 'failed'           # 失败
-
-# 任务数据模型
-# class TaskModel(Base):
-#     __tablename__ = 'tasks'
-#     task_id = Column(String, primary_key=True)        # 任务唯一 ID
-#     input_data = Column(JSON)                       # 输入数据
-#     status = Column(String, default=TaskStatus.PENDING)  # 当前状态，默认为待处理
-#     retries = Column(Integer, default=0)              # 重试次数
-#     result = Column(JSON)                           # 推理结果
-#     created_at = Column(DateTime, default=datetime.now)   # 创建时间
-#     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)  # 任务 完成/失败 时间
-
-def create_task_model(table_name: str):
-    """根据指定表名动态创建 TaskModel 类"""
-    class TaskModel(Base):
-        __tablename__ = table_name
-        task_id = Column(String, primary_key=True)
-        input_data = Column(JSON)
-        status = Column(String, default=TaskStatus.PENDING)
-        retries = Column(Integer, default=0)
-        result = Column(JSON)
-        created_at = Column(DateTime, default=datetime.now)
-        updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
-    return TaskModel
+logger = logging.getLogger(__name__)
+
+# ClaimedTask、MemoryTaskStore 等从 task_store 导入的对象在此重新导出，兼容原先从 task_manager 导入的代码；
+# SQLiteTaskStore 等 SQLAlchemy 相关对象由下方 __getattr__ 按需导入，不列入 __all__，import * 时不加载 SQLAlchemy
+__all__ = ["TaskManager", "RetryPolicy", "DeadlineExceeded", "DB_URL",
+           "TaskStatus", "TASK_COLUMNS", "ClaimedTask", "TaskStore", "MemoryTaskStore"]
+
+
+def __getattr__(name):
+    # SQLiteTaskStore 等 SQLAlchemy 相关对象按需从 task_store 导入
+    from . import task_store
+    if name in task_store._SQL_NAMES:
+        return getattr(task_store, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _merge_chunks(chunks: list):
+    """合并流式推理的输出块：全部为字符串(如 token)时拼接为文本，否则保留为块列表"""
+    if all(isinstance(chunk, str) for chunk in chunks):
+        return "".join(chunks)
+    return list(chunks)
+
+
+def _iter_task_inputs(source, input_column: str = "input"):
+    """
+    逐条产出任务输入，支持：
+    - 任意可迭代对象(列表、生成器等)；
+    - .jsonl 文件路径：每行一个 JSON，若为包含 input_column 的对象则取该字段，否则取整行；
+    - .json 文件路径：顶层为数组，每个元素一个任务，元素的取值方式同 .jsonl；
+    - .csv 文件路径：取 input_column 列。
+    """
+    if not isinstance(source, (str, os.PathLike)):
+        yield from source
+        return
+    path = os.fspath(source)
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            if input_column not in (reader.fieldnames or []):
+                raise ValueError(f"column '{input_column}' not found in {path}")
+            for row in reader:
+                yield row[input_column]
+    elif path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                data = json.loads(line)
+                if isinstance(data, dict) and input_column in data:
+                    data = data[input_column]
+                yield data
+    elif path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            items = json.load(f)
+        if not isinstance(items, list):
+            raise ValueError(f"{path} must contain a JSON array of task inputs")
+        for data in items:
+            if isinstance(data, dict) and input_column in data:
+                data = data[input_column]
+            yield data
+    else:
+        raise ValueError(f"unsupported task file: {path}, expected .jsonl, .json or .csv")
+
+
+def _input_hash(input_data) -> Optional[str]:
+    try:
+        return payload_hash(input_data)
+    except UnhashablePayload:
+        return None
+
+
+class DeadlineExceeded(Exception):
+    """任务在推理前已超过截止时间，直接标记为失败，不再重试"""
+
+
+# 失败重试策略
+class RetryPolicy:
+    """
+    任务失败重试策略：单个任务失败后按指数退避延迟重新领取，累计失败 max_retries 次后标记为失败。
+
+    参数：
+    - max_retries (int): 单个任务最多失败次数，默认 3；
+    - backoff_base (float): 第 n 次失败后等待 backoff_base * 2**(n-1) 秒再重新领取，默认 1，为 0 时立即重试；
+    - backoff_max (float): 退避等待上限(秒)，默认 60。
+    """
+
+    def __init__(self, max_retries: int = 3, backoff_base: float = 1, backoff_max: float = 60):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def should_fail(self, retries: int) -> bool:
+        """累计失败 retries 次后是否放弃重试"""
+        return retries >= self.max_retries
+
+    def delay(self, retries: int) -> float:
+        """累计失败 retries 次后的退避等待时间(秒)"""
+        return min(self.backoff_max, self.backoff_base * (2 ** (retries - 1)))
 
 # 任务管理器
 class TaskManager:
@@ -56,150 +131,540 @@ class TaskManager:
     - 提供任务进度监控和结果查询接口。
 
     参数：
-    - db_url (str): 数据库连接字符串，用于任务持久化；
+    - task_name (str): 任务名，即任务表名；
     - engine: 推理引擎对象，需实现 batch_forward(inputs: List[str]) -> List[Any]；
     - process_result_func (Optional[Callable]): 可选的自定义结果处理函数；
-    - batch_size (int): 每批推理处理的任务数量，默认值为 16。
+    - batch_size (int): 每批推理处理的任务数量，默认值为 16；
+    - store (Optional[TaskStore]): 任务存储后端，如 MemoryTaskStore()；缺省使用 SQLiteTaskStore；
+    - db_url (Optional[str]): 未指定 store 时 SQLiteTaskStore 的数据库连接字符串，默认 DB_URL；
+    - worker_id (Optional[str]): 当前 worker 的标识，缺省为 "主机名-进程号-随机串"；
+    - lease_seconds (float): 领取任务的租约时长(秒)，运行期间每 lease_seconds/3 续约一次，默认 60；
+    - retry_policy (Optional[RetryPolicy]): 失败重试策略，缺省为 RetryPolicy()；
+    - bisect_failures (bool): 批次推理抛出异常时是否自动二分拆批、定位出错的任务，默认 True。
+      开启后只有真正出错的任务计入重试次数，同批的正常任务直接完成；任务的错误信息写入 error 列；
+    - batch_sizer (Optional[AdaptiveBatchSizer]): 自适应批大小，设置后忽略 batch_size，按实测延迟/吞吐调整每批任务数；
+      若推理引擎提供 num_replicas()(如 MultiNodeDeployment)，每 replica_check_interval 秒按副本数变化缩放批大小；
+    - replica_check_interval (float): 查询推理服务副本数的间隔(秒)，默认 30；
+    - cache (Optional[ResultCache]): 结果缓存，设置后每批任务先查缓存，命中的任务直接完成，同批内相同输入只推理一次；
+    - cache_namespace (Optional[str]): 缓存命名空间，缺省沿用推理引擎的 cache_namespace(如 MultiNodeDeployment 的 "部署名:版本")；
+    - stream_partials (bool): 流式推理，默认 False。开启后每个任务通过引擎的 inference_stream(input) 逐块获取结果，
+      推理过程中每 partial_interval 秒将已收到的部分结果写入处理中任务的 result 列(字符串块拼接，其他类型为块列表)，
+      完成后写入完整结果；各任务独立请求，出错的任务单独重试，不再二分拆批；
+    - partial_interval (float): 部分结果的写入间隔(秒)，默认 1。
+
+    多个进程(或 Ray task)可各自创建 TaskManager 并同时调用 run_tasks 消费同一任务表：
+    每批任务以租约方式领取，只有持有者崩溃、租约过期后才会被其他 worker 回收重做。
+
+    任务按优先级从高到低领取，同优先级按加载顺序；多个任务表(作业)共用一个推理服务时，
+    可交给 JobScheduler 按权重公平分配推理并发。
     """
 
-    def __init__(self, task_name: str, engine, process_result_func: Optional[Callable] = None, batch_size: int = 16):
+    def __init__(self, task_name: str, engine, process_result_func: Optional[Callable] = None, batch_size: int = 16,
+                 store: Optional[TaskStore] = None, db_url: Optional[str] = None,
+                 worker_id: Optional[str] = None, lease_seconds: float = 60,
+                 retry_policy: Optional[RetryPolicy] = None, bisect_failures: bool = True,
+                 batch_sizer: Optional[AdaptiveBatchSizer] = None, replica_check_interval: float = 30,
+                 cache: Optional[ResultCache] = None, cache_namespace: Optional[str] = None,
+                 stream_partials: bool = False, partial_interval: float = 1.0):
         self.engine = engine                                # 推理引擎，需实现 batch_forward 方法
         self._process_result = process_result_func          # 自定义结果处理函数，如不传入，则将结果写入数据库result字段
         self.batch_size = batch_size                        # 每批任务处理数量
-
-        self._engine = create_engine(DB_URL)                # 创建数据库引擎
-        self.task_model = create_task_model(task_name)
-        Base.metadata.create_all(self._engine)             # 创建表结构
-        self.Session = sessionmaker(bind=self._engine)     
+        self.task_name = task_name
+        if store is None:
+            from .sqlite_task_store import SQLiteTaskStore
+            store = SQLiteTaskStore(db_url or DB_URL, task_name)
+        self.store = store                                  # 任务存储后端
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.bisect_failures = bisect_failures
+        self.batch_sizer = batch_sizer
+        self.replica_check_interval = replica_check_interval
+        self.cache = cache
+        self.cache_namespace = cache_namespace
+        if stream_partials and not callable(getattr(engine, "inference_stream", None)):
+            raise ValueError("stream_partials requires an engine with inference_stream(input)")
+        self.stream_partials = stream_partials
+        self.partial_interval = partial_interval
 
     # 加载任务数据到数据库
-    def load_tasks(self, tasks: List[str], clear_existing_data: bool = True):
-        session = self.Session()
-        try:
-            if clear_existing_data:
-                session.query(self.task_model).delete()
-                session.commit()
-            for input_data in tasks:
-                task = self.task_model(
-                    task_id=str(uuid.uuid4()),
-                    input_data=input_data,
-                    status=TaskStatus.PENDING
-                )
-                session.add(task)
-            session.commit()
-        finally:
-            session.close()
+    def load_tasks(self, tasks, clear_existing_data: bool = True, chunk_size: int = 10000,
+                   dedupe: bool = False, input_column: str = "input", priority: int = 0,
+                   deadline: Union[datetime, float, None] = None) -> int:
+        """
+        流式加载任务数据，按块批量插入任务存储。
+
+        参数：
+        - tasks: 任务输入，可为任意可迭代对象(列表、生成器)，或 .jsonl / .json(数组) / .csv 文件路径；
+        - clear_existing_data (bool): 加载前是否清空已有任务，默认 True；
+        - chunk_size (int): 每次批量插入并提交的条数，默认 10000；
+        - dedupe (bool): 是否按输入内容哈希跳过重复输入(包括存储中已有的任务)，默认 False；无法计算内容哈希的输入不去重；
+        - input_column (str): 从 JSONL 对象 / CSV 行中读取输入的字段名，默认 "input"；
+        - priority (int): 本次加载任务的优先级，越大越先领取，默认 0。可用 clear_existing_data=False
+          追加加载高优先级任务(如交互式补数)，使其插队到批量任务之前；
+        - deadline (datetime | float, 可选): 本次加载任务的截止时间，或距现在的秒数；带时区的 datetime 转换为本地时间保存；
+          领取时已过截止时间的任务不再推理，直接标记为失败(error 为 DeadlineExceeded)。
+
+        返回：
+        - int: 实际插入的任务数。
+        """
+        loaded, skipped = 0, 0
+        start = time.perf_counter()
+        if clear_existing_data:
+            self.store.clear()
+
+        def flush(rows):
+            nonlocal loaded, skipped
+            if dedupe:
+                existing = self.store.existing_hashes(list({row["input_hash"] for row in rows} - {None}))
+                unique = []
+                for row in rows:
+                    if row["input_hash"] is None:       # 无法计算内容哈希的输入不去重
+                        unique.append(row)
+                    elif row["input_hash"] not in existing:
+                        existing.add(row["input_hash"])
+                        unique.append(row)
+                skipped += len(rows) - len(unique)
+                rows = unique
+            self.store.insert(rows)
+            loaded += len(rows)
+            elapsed = time.perf_counter() - start
+            logger.info(f"已加载 {loaded} 条任务(跳过重复 {skipped} 条), {(loaded + skipped) / elapsed:.0f} 条/秒",
+                        extra={"event": "tasks_loaded", "task": self.task_name, "loaded": loaded, "skipped": skipped,
+                               "rate": (loaded + skipped) / elapsed})
+
+        rows = []
+        now = datetime.now()
+        if isinstance(deadline, (int, float)):
+            deadline = now + timedelta(seconds=deadline)
+        elif deadline is not None and deadline.tzinfo is not None:
+            # 任务存储中的时间均为本地时间(不带时区)，与领取时的 datetime.now() 比较
+            deadline = deadline.astimezone().replace(tzinfo=None)
+        for input_data in _iter_task_inputs(tasks, input_column):
+            rows.append({
+                "task_id": str(uuid.uuid4()),
+                "input_data": input_data,
+                "input_hash": _input_hash(input_data),
+                "status": TaskStatus.PENDING,
+                "retries": 0,
+                "priority": priority,
+                "deadline": deadline,
+                "created_at": now,
+                "updated_at": now,
+            })
+            if len(rows) >= chunk_size:
+                flush(rows)
+                rows = []
+                now = datetime.now()
+        if rows:
+            flush(rows)
+        return loaded
 
     # 执行任务调度和推理
-    def run_tasks(self):
-        session = self.Session()
-        try:
-            # 将可能因中断而卡住的处理中任务恢复为待处理
-            session.query(self.task_model).filter(self.task_model.status == TaskStatus.PROCESSING).update({self.task_model.status: TaskStatus.PENDING})
-            session.commit()
+    def run_tasks(self, max_in_flight: int = 2, status_interval: float = 5.0):
+        """
+        以流水线方式调度并执行全部待处理任务，直至没有可领取的任务为止。
+
+        流水线分三段并发执行：
+        - 取数：在专用存储线程中领取下一批 PENDING 任务(标记为 PROCESSING)，当前批次推理期间即预取下一批；
+        - 推理：至多 max_in_flight 个批次同时在推理引擎上执行；
+        - 写回：独立的写回协程按完成顺序提交结果，不阻塞后续批次的推理；自定义结果处理函数在存储线程中调用；
+        - 续约：后台定期为已领取、尚未写回的任务续约，租约被回收的任务不会再被本 worker 写回。
+
+        开启 metrics.configure(metrics=True) 后统计各存储操作(领取、写回、续约等，在存储线程内计时)与每批推理的耗时、
+        写回任务数；开启追踪时每批推理记录一个 span，批内经 MultiNodeDeployment 发出的请求为其子 span。
+
+        中断遗留的处理中任务在其租约过期后由下一次领取自动回收，无需启动时整体重置。
+
+        参数：
+        - max_in_flight (int): 同时在推理引擎上执行的批次数，默认 2；
+        - status_interval (float): 打印任务进度的最小间隔(秒)，默认 5；进度由内存计数器增量维护，不查询存储。
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be >= 1")
+        asyncio.run(self._run_pipeline(max_in_flight, status_interval))
+
+    async def _run_pipeline(self, max_in_flight: int, status_interval: float, gate=None):
+        # gate: 多个作业共用推理服务时的并发名额(JobScheduler)，每批推理前 acquire(批大小)，完成后 release()
+        loop = asyncio.get_running_loop()
+        # SQLite 连接不宜跨线程并发写，所有存储操作串行提交到同一线程
+        db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-db")
+
+        def run_db(func, *args):
+            func = metrics.timed(func, "mn_task_db_seconds", task=self.task_name, op=func.__name__.lstrip("_"))
+            return loop.run_in_executor(db_executor, func, *args)
+
+        slots = asyncio.Semaphore(max_in_flight)    # 推理在途批次名额
+        completions = asyncio.Queue()               # 推理完成、待写回的批次
+        # 已领取未写回的批次数、已写回批次序号、上次打印进度的时间
+        state = {"outstanding": 0, "commit_seq": 0, "last_report": time.monotonic()}
+        committed = asyncio.Event()
+        counts = {}                                 # 各状态任务数，启动时查询一次，之后增量更新
+
+        async def call_engine(inputs):
+            with metrics.timer("mn_task_engine_seconds", span="task_manager.batch", task=self.task_name):
+                if asyncio.iscoroutinefunction(self.engine.batch_forward):
+                    results = await self.engine.batch_forward(inputs)
+                else:
+                    results = await loop.run_in_executor(None, self.engine.batch_forward, inputs)
+            results = list(results)
+            if len(results) != len(inputs):
+                raise ValueError(f"engine returned {len(results)} results for {len(inputs)} inputs")
+            return results
+
+        async def forward_isolated(batch):
+            # 返回 [(任务, 结果, 异常)]；批次出错时二分拆批重试，直至定位到出错的单个任务
+            try:
+                results = await call_engine([task.input_data for task in batch])
+                return [(task, result, None) for task, result in zip(batch, results)]
+            except Exception as batch_e:
+                if len(batch) == 1 or not self.bisect_failures:
+                    return [(task, None, batch_e) for task in batch]
+                mid = len(batch) // 2
+                left, right = await asyncio.gather(forward_isolated(batch[:mid]), forward_isolated(batch[mid:]))
+                return left + right
+
+        partials = {}                               # 流式推理中的任务 task_id -> 已收到的块
+        dirty = set()                               # 上次写入后收到新块的任务
+
+        async def stream_one(task):
+            chunks = partials.setdefault(task.task_id, [])
+            try:
+                async for chunk in self.engine.inference_stream(task.input_data):
+                    chunks.append(chunk)
+                    dirty.add(task.task_id)
+                return _merge_chunks(chunks)
+            finally:
+                partials.pop(task.task_id, None)
+                dirty.discard(task.task_id)
+
+        async def forward_streaming(batch):
+            results = await asyncio.gather(*[stream_one(task) for task in batch], return_exceptions=True)
+            return [(task, None, result) if isinstance(result, Exception) else (task, result, None)
+                    for task, result in zip(batch, results)]
+
+        async def flush_partials():
+            # 部分结果不释放租约；任务写回后状态不再是处理中，迟到的部分结果不会覆盖最终结果
+            while True:
+                await asyncio.sleep(self.partial_interval)
+                if dirty:
+                    results = {task_id: json.dumps(_merge_chunks(partials[task_id]))
+                               for task_id in list(dirty) if task_id in partials}
+                    dirty.clear()
+                    await run_db(self.store.write_partials, results, self.worker_id)
+
+        async def forward_cached(batch, forward_uncached):
+            # 先查缓存，未命中的输入按内容去重后再交给推理引擎
+            namespace = self.cache_namespace if self.cache_namespace is not None \
+                else getattr(self.engine, "cache_namespace", "")
+            outcomes, groups = {}, {}     # groups: 缓存键 -> 输入相同的未命中任务
+            for task in batch:
+                key = self.cache.key(task.input_data, namespace)
+                if key is None:
+                    # 无法按内容精确计算哈希的输入不查缓存、不与其他任务合并
+                    groups[(None, task.task_id)] = [task]
+                    continue
+                result = self.cache.get(key)
+                if result is not MISSING:
+                    outcomes[task.task_id] = (task, result, None)
+                else:
+                    groups.setdefault(key, []).append(task)
+            if groups:
+                keys = list(groups)
+                for (_, result, error), key in zip(await forward_uncached([groups[key][0] for key in keys]), keys):
+                    if error is None and result is not None and isinstance(key, str):
+                        self.cache.put(key, result)
+                    for task in groups[key]:
+                        outcomes[task.task_id] = (task, result, error)
+            return [outcomes[task.task_id] for task in batch]
+
+        async def forward_live(batch):
+            if gate is not None:
+                await gate.acquire(len(batch))
+            try:
+                start = time.perf_counter()
+                forward_uncached = forward_streaming if self.stream_partials else forward_isolated
+                outcomes = await (forward_cached(batch, forward_uncached) if self.cache else forward_uncached(batch))
+                if self.batch_sizer and all(error is None for _, _, error in outcomes):
+                    self.batch_sizer.record(len(batch), time.perf_counter() - start)
+                return outcomes
+            finally:
+                if gate is not None:
+                    gate.release()
+
+        async def forward(batch):
+            try:
+                try:
+                    # 已过截止时间的任务不再推理
+                    now = datetime.now()
+                    live = [task for task in batch if task.deadline is None or task.deadline > now]
+                    outcomes = [(task, None, DeadlineExceeded(f"deadline {task.deadline} exceeded"))
+                                for task in batch if task.deadline is not None and task.deadline <= now]
+                    if live:
+                        outcomes += await forward_live(live)
+                except Exception as e:
+                    # 推理引擎以外的异常(缓存读写、批大小统计等)同样记为本批各任务的失败并交给写回，
+                    # 否则该批次永远不会写回，主循环一直等待
+                    logger.warning(f"批次处理出错: {type(e).__name__}: {e}",
+                                   extra={"event": "batch_failed", "task": self.task_name})
+                    outcomes = [(task, None, e) for task in batch]
+                await completions.put((batch, outcomes))
+            finally:
+                slots.release()
+
+        async def watch_replicas():
+            # 推理服务扩缩容后按副本数缩放批大小
             while True:
-                # 查询待处理任务
-                tasks = session.query(self.task_model).filter(self.task_model.status == TaskStatus.PENDING).limit(self.batch_size).all()
-                if not tasks:
-                    break
-                
-                inputs = []
-                task_map = {}
-                for task in tasks:
-                    task.status = TaskStatus.PROCESSING
-                    task_map[task.task_id] = task
-                    inputs.append(task.input_data)
-                session.commit()
                 try:
-                    if asyncio.iscoroutinefunction(self.engine.batch_forward):
-                        results = asyncio.run(self.engine.batch_forward(inputs))
-                    else:
-                        results = self.engine.batch_forward(inputs)
-                except Exception as batch_e:
-                    # 批量处理失败，标记每个任务状态为待处理或失败
-                    for task in tasks:
-                        task.retries += 1
-                        if task.retries > 3:
-                            task.status = TaskStatus.FAILED
-                        else:
-                            task.status = TaskStatus.PENDING
-                    session.commit()
-                    continue 
-
-                for task, result in zip(tasks, results):
-                    if result is None:  # 判定失败条件，待修改
-                        task.retries += 1
-                        if task.retries >= 3:
-                            task.status = TaskStatus.FAILED
-                        else:
-                            task.status = TaskStatus.PENDING
-                    else:
-                        if self._process_result:
-                            self._process_result(task.task_id, result)  # 使用自定义处理函数
-                            task.result = None
-                        else:
-                            task.result = json.dumps(result)            # 默认保存结果为 JSON 字符串
-                        task.status = TaskStatus.COMPLETED
-                    task.updated_at = datetime.now()
-                session.commit()
-                self._print_task_status(session)                 # 实时打印状态
+                    num_replicas = await loop.run_in_executor(None, self.engine.num_replicas)
+                    self.batch_sizer.update_replicas(num_replicas)
+                except Exception as e:
+                    logger.warning(f"查询副本数失败: {e}", extra={"event": "replica_check_failed", "task": self.task_name})
+                await asyncio.sleep(self.replica_check_interval)
+
+        leased = set()                              # 已领取未写回的任务 task_id
+
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(self.lease_seconds / 3)
+                if leased:
+                    await run_db(self.store.heartbeat, list(leased), self.worker_id, self.lease_seconds)
+
+        async def writer():
+            while True:
+                item = await completions.get()
+                if item is None:
+                    break
+                batch, outcomes = item
+                transitions = await run_db(self._commit_batch, outcomes)
+                for task in batch:
+                    leased.discard(task.task_id)
+                counts[TaskStatus.PROCESSING] -= len(batch)
+                for status, n in transitions.items():
+                    counts[status] += n
+                    metrics.inc("mn_tasks_total", n, task=self.task_name, status=status)
+                if time.monotonic() - state["last_report"] >= status_interval:
+                    self._print_task_status(counts)     # 按间隔打印进度
+                    state["last_report"] = time.monotonic()
+                state["outstanding"] -= 1
+                state["commit_seq"] += 1
+                committed.set()
+
+        background = []                             # 写回、续约等后台协程，结束或出错时统一取消
+        forward_tasks = set()
+        next_batch = None
+
+        def check_writer():
+            # 写回协程只在收到结束标记后正常退出，提前结束即写回出错(如结果无法序列化、自定义结果处理函数抛出异常)，
+            # 将其异常抛给 run_tasks 的调用方，避免主循环一直等待写回
+            if writer_task.done():
+                writer_task.result()
+
+        try:
+            counts.update(await run_db(self._count_by_status))
+            writer_task = asyncio.create_task(writer())
+            background.append(writer_task)
+            background.append(asyncio.create_task(heartbeat()))
+            if self.batch_sizer and callable(getattr(self.engine, "num_replicas", None)):
+                background.append(asyncio.create_task(watch_replicas()))
+            if self.stream_partials:
+                background.append(asyncio.create_task(flush_partials()))
+
+            async def claim():
+                batch_size = self.batch_sizer.size if self.batch_sizer else self.batch_size
+                batch = await run_db(self.store.claim, batch_size, self.worker_id, self.lease_seconds)
+                # 预取的批次在等待推理名额期间同样需要续约
+                leased.update(task.task_id for task in batch)
+                return batch
+
+            def prefetch():
+                return state["commit_seq"], asyncio.ensure_future(claim())
+
+            claim_seq, next_batch = prefetch()
+            while True:
+                check_writer()
+                await slots.acquire()
+                batch = await next_batch
+                if not batch:
+                    slots.release()
+                    # 没有可领取的任务：若仍有批次未写回，等待其写回(失败任务可能重新变为待处理)后再次领取
+                    if state["outstanding"] > 0:
+                        committed.clear()
+                        waiter = asyncio.ensure_future(committed.wait())
+                        await asyncio.wait({waiter, writer_task}, return_when=asyncio.FIRST_COMPLETED)
+                        waiter.cancel()
+                        check_writer()
+                    elif claim_seq == state["commit_seq"]:
+                        # 仅剩处于重试退避期的任务时，等到最早可领取的时间
+                        available_at = await run_db(self.store.next_available_at)
+                        if available_at is None:
+                            break
+                        await asyncio.sleep(max(0.0, (available_at - datetime.now()).total_seconds()))
+                    claim_seq, next_batch = prefetch()
+                    continue
+                state["outstanding"] += 1
+                counts[TaskStatus.PENDING] -= len(batch)
+                counts[TaskStatus.PROCESSING] += len(batch)
+                claim_seq, next_batch = prefetch()      # 当前批次推理期间预取下一批
+                task = asyncio.create_task(forward(batch))
+                forward_tasks.add(task)
+                task.add_done_callback(forward_tasks.discard)
+
+            await completions.put(None)
+            await writer_task
+            # 其他 worker 可能同时修改任务状态，结束时重新统计一次
+            self._print_task_status(await run_db(self._count_by_status))
         finally:
-            session.close()
+            # 出错时未写回的任务保持处理中，租约过期后由下一次领取回收
+            pending = [task for task in [*background, *forward_tasks, next_batch] if task and not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            db_executor.shutdown(wait=True)
+
+    # 写回一批任务的推理结果，outcomes 为 [(任务, 结果, 异常)]。返回本批任务的新状态计数
+    def _commit_batch(self, outcomes):
+        transitions = {TaskStatus.PENDING: 0, TaskStatus.COMPLETED: 0, TaskStatus.FAILED: 0}
+        updates = []
+        now = datetime.now()
+        for task, result, error in outcomes:
+            if error is None and result is None:  # 判定失败条件，待修改
+                error = "engine returned None"
+            if error is not None:
+                retries = task.retries + 1
+                failed = isinstance(error, DeadlineExceeded) or self.retry_policy.should_fail(retries)
+                status = TaskStatus.FAILED if failed else TaskStatus.PENDING
+                if isinstance(error, Exception):
+                    error = f"{type(error).__name__}: {error}"
+                updates.append({
+                    "task_id": task.task_id, "status": status, "retries": retries, "result": None,
+                    "error": str(error)[:2000],
+                    "available_at": None if failed else now + timedelta(seconds=self.retry_policy.delay(retries)),
+                })
+            else:
+                if self._process_result:
+                    self._process_result(task.task_id, result)  # 使用自定义处理函数
+                    result = None
+                else:
+                    result = json.dumps(result)                 # 默认保存结果为 JSON 字符串
+                status = TaskStatus.COMPLETED
+                updates.append({"task_id": task.task_id, "status": status, "retries": task.retries,
+                                "result": result, "error": None, "available_at": None})
+            transitions[status] += 1
+        self.store.update(updates, worker_id=self.worker_id)
+        return transitions
+
+    # 按状态统计任务数(单次 GROUP BY 查询)
+    def _count_by_status(self):
+        counts = {TaskStatus.PENDING: 0, TaskStatus.PROCESSING: 0, TaskStatus.COMPLETED: 0, TaskStatus.FAILED: 0}
+        counts.update(self.store.count_by_status())
+        return counts
 
     # 获取任务整体状态
     def _get_task_status(self):
-        session = self.Session()
-        try:
-            total = session.query(self.task_model).count()                         # 总任务数
-            completed = session.query(self.task_model).filter(self.task_model.status == TaskStatus.COMPLETED).count()
-            failed = session.query(self.task_model).filter(self.task_model.status == TaskStatus.FAILED).count()
-            pending = session.query(self.task_model).filter(self.task_model.status == TaskStatus.PENDING).count()
-            processing = session.query(self.task_model).filter(self.task_model.status == TaskStatus.PROCESSING).count()
-            percent = completed / total * 100 if total else 0
-            return {
-                "total": total,
-                "completed": completed,
-                "failed": failed,
-                "pending": pending,
-                "processing": processing,
-                "percent": f"{percent:.2f}%"
-            }
-        finally:
-            session.close()
-
-    # 打印当前任务进度
-    def _print_task_status(self, session):
-        total = session.query(self.task_model).count()
-        completed = session.query(self.task_model).filter(self.task_model.status == TaskStatus.COMPLETED).count()
-        failed = session.query(self.task_model).filter(self.task_model.status == TaskStatus.FAILED).count()
-        print(f"任务进度: 已完成 {completed}/{total}, 失败 {failed}")
+        counts = self._count_by_status()
+        total = sum(counts.values())
+        completed = counts[TaskStatus.COMPLETED]
+        percent = completed / total * 100 if total else 0
+        return {
+            "total": total,
+            "completed": completed,
+            "failed": counts[TaskStatus.FAILED],
+            "pending": counts[TaskStatus.PENDING],
+            "processing": counts[TaskStatus.PROCESSING],
+            "percent": f"{percent:.2f}%"
+        }
+
+    # 输出当前任务进度
+    def _print_task_status(self, counts: dict = None):
+        counts = counts or self._count_by_status()
+        total = sum(counts.values())
+        logger.info(f"任务进度: 已完成 {counts[TaskStatus.COMPLETED]}/{total}, 失败 {counts[TaskStatus.FAILED]}",
+                    extra={"event": "task_progress", "task": self.task_name, "total": total, **counts})
     
     # 查询单个任务的推理结果
     def get_result(self, task_id: str) -> Optional[str]:
-        session = self.Session()
+        return self.store.get_result(task_id)
+
+    # 逐条返回结果
+    def iter_results(self, page_size: int = 1000, columns: Optional[List[str]] = None,
+                     status: Optional[str] = TaskStatus.COMPLETED,
+                     since: Optional[datetime] = None, until: Optional[datetime] = None):
+        """
+        以生成器形式逐条返回任务结果，按 task_id 做键集分页(keyset pagination)，每页单独查询，内存占用与结果总量无关。
+
+        参数：
+        - page_size (int): 每页查询的行数，默认 1000；
+        - columns (List[str], 可选): 需要返回的列名，如 ["task_id", "result"]；缺省返回 {"input": ..., "output": ...}；
+        - status (str, 可选): 仅返回该状态的任务，默认 COMPLETED，传 None 返回全部；
+        - since / until (datetime, 可选): 按更新时间 updated_at 过滤，区间为 [since, until)。
+        """
+        if columns:
+            unknown = [name for name in columns if name not in TASK_COLUMNS]
+            if unknown:
+                raise ValueError(f"unknown columns: {unknown}")
+            yield from self.store.iter_rows(columns, page_size=page_size, status=status, since=since, until=until)
+            return
+        for row in self.store.iter_rows(["input_data", "result"], page_size=page_size, status=status,
+                                        since=since, until=until):
+            yield {"input": row["input_data"], "output": row["result"]}
+
+    # 将结果流式导出到文件
+    def export_results(self, path: str, format: Optional[str] = None, **kwargs) -> int:
+        """
+        基于 iter_results 将结果流式写入 JSONL 或 Parquet 文件，内存占用恒定。
+
+        参数：
+        - path (str): 输出文件路径；
+        - format (str, 可选): "jsonl" 或 "parquet"，缺省按文件后缀推断；
+        - kwargs: 透传给 iter_results 的参数(page_size、columns、status、since、until)。
+
+        返回：
+        - int: 导出的行数。
+        """
+        format = format or ("parquet" if path.endswith(".parquet") else "jsonl")
+        count = 0
+        if format == "jsonl":
+            with open(path, "w", encoding="utf-8") as f:
+                for row in self.iter_results(**kwargs):
+                    f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+                    count += 1
+            return count
+        if format != "parquet":
+            raise ValueError(f"unsupported export format: {format}")
+
         try:
-            task = session.query(self.task_model).filter(self.task_model.task_id == task_id).first()
-            if task:
-                return task.result
-            return None
-        finally:
-            session.close()
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("export to parquet requires pyarrow, please `pip install pyarrow`")
 
-    # 返回所有结果
-    def iter_results(self):
-        results = []
-        session = self.Session()
+        def to_cell(value):
+            # JSON 列的取值类型不固定，嵌套结构统一编码为 JSON 字符串
+            return json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+
+        page_size = kwargs.get("page_size", 1000)
+        writer, rows = None, []
         try:
-            for task in session.query(self.task_model).filter(self.task_model.status == TaskStatus.COMPLETED):
-                # print(f"Input: {task.input_data}\nResult: {task.result}\n")
-                results.append({"input": task.input_data, "output": task.result})
+            for row in self.iter_results(**kwargs):
+                rows.append({key: to_cell(value) for key, value in row.items()})
+                if len(rows) >= page_size:
+                    table = pa.Table.from_pylist(rows)
+                    writer = writer or pq.ParquetWriter(path, table.schema)
+                    writer.write_table(table.cast(writer.schema))
+                    count += len(rows)
+                    rows = []
+            if rows or writer is None:
+                table = pa.Table.from_pylist(rows)
+                writer = writer or pq.ParquetWriter(path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+                count += len(rows)
         finally:
-            session.close()
-        return results
-
+            if writer is not None:
+                writer.close()
+        return count
 
 if __name__ == "__main__":
-    import time
     class DummyEngine:
         def batch_forward(self, inputs):
             time.sleep(1)  # 模拟耗时
@@ -219,7 +684,8 @@ if __name__ == "__main__":
     manager.run_tasks()
 
     # 打印结果
-    manager.iter_results()
+    for item in manager.iter_results():
+        print(item)
     
     
 
@@ -0,0 +1,307 @@
+import os
+import json
+import heapq
+import threading
+from datetime import datetime, timedelta
+from collections import namedtuple
+from typing import List, Optional, Iterable
+
+# 任务状态定义类
+class TaskStatus:
+    PENDING = 'pending'         # 待处理
+    PROCESSING = 'processing'   # 处理中
+    COMPLETED = 'completed'     # 已完成
+    FAILED = 'failed'           # 失败
+
+# 被领取的任务；deadline 为任务的截止时间，过期的任务不再推理
+ClaimedTask = namedtuple("ClaimedTask", ["task_id", "input_data", "retries", "deadline"], defaults=(None,))
+
+# 任务表的全部列
+TASK_COLUMNS = ("task_id", "input_data", "status", "retries", "result", "error", "input_hash", "worker_id",
+                "lease_expires_at", "available_at", "created_at", "updated_at", "priority", "deadline")
+
+# update() 可写入的列
+UPDATE_COLUMNS = ("status", "retries", "result", "error", "available_at")
+
+
+class TaskStore:
+    """
+    任务存储后端接口，TaskManager 通过它完成任务的持久化、领取与状态更新。
+
+    多个 worker 通过租约协同消费同一任务队列：claim 时为任务记录 worker_id 与租约到期时间，
+    worker 定期 heartbeat 续约；只有租约已过期的处理中任务才会被重新领取。
+    实现需保证 claim 的原子性：同一任务不会被并发的多个调用同时领取。
+    """
+
+    def insert(self, rows: List[dict]):
+        """
+        批量插入任务，rows 中每项包含 task_id、input_data、input_hash、status、retries、priority、deadline、
+        created_at、updated_at
+        """
+        raise NotImplementedError
+
+    def existing_hashes(self, hashes: List[str]) -> set:
+        """返回 hashes 中已存在于存储中的输入哈希"""
+        raise NotImplementedError
+
+    def clear(self):
+        """清空全部任务"""
+        raise NotImplementedError
+
+    def claim(self, limit: int, worker_id: str, lease_seconds: float) -> List[ClaimedTask]:
+        """
+        原子地领取至多 limit 个任务并标记为处理中，租约期限为 lease_seconds。
+        领取前先将租约已过期(或没有租约)的处理中任务回收为待处理，再按优先级从高到低、同优先级按创建顺序领取；
+        处于重试退避期(available_at 晚于当前时间)的任务不会被领取。
+        """
+        raise NotImplementedError
+
+    def next_available_at(self) -> Optional[datetime]:
+        """返回处于退避期的待处理任务中最早可领取的时间，没有则返回 None"""
+        raise NotImplementedError
+
+    def heartbeat(self, task_ids: List[str], worker_id: str, lease_seconds: float) -> int:
+        """为 worker 仍持有的处理中任务续约，返回续约成功的任务数"""
+        raise NotImplementedError
+
+    def write_partials(self, results: dict, worker_id: str) -> int:
+        """
+        写入流式推理的部分结果 {task_id: result}，仅更新 worker 仍持有的处理中任务的 result 列，不改变状态与租约，
+        返回写入的任务数
+        """
+        raise NotImplementedError
+
+    def update(self, updates: List[dict], worker_id: Optional[str] = None):
+        """
+        在一个事务内批量更新任务，updates 中每项包含 task_id 及 UPDATE_COLUMNS 中的全部列。
+        指定 worker_id 时仅更新仍由该 worker 持有的处理中任务，租约已被回收的任务不会被覆盖。
+        """
+        raise NotImplementedError
+
+    def count_by_status(self) -> dict:
+        """返回各状态的任务数"""
+        raise NotImplementedError
+
+    def get_result(self, task_id: str):
+        raise NotImplementedError
+
+    def iter_rows(self, columns: List[str], page_size: int = 1000, status: Optional[str] = None,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None) -> Iterable[dict]:
+        """按 task_id 顺序分页逐行返回指定列，可按状态与更新时间 [since, until) 过滤"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryTaskStore(TaskStore):
+    """
+    进程内任务存储，适合单进程作业与本地调试，无数据库往返开销。
+
+    - 任务保存在内存字典中，待处理任务按(优先级, 创建顺序)保存在堆中，领取为 O(log n)；
+    - 与 SQLiteTaskStore 相同的租约语义，可供同一进程内的多个 TaskManager 共享；
+    - 指定 path 时以追加日志(JSONL)方式持久化每次插入/更新，重启后回放日志恢复状态，clear() 时截断日志。
+
+    注意：仅保证单进程内的线程安全，多个进程不可共享同一个日志文件。
+
+    参数：
+    - path (str, 可选): 持久化日志文件路径，缺省为纯内存存储。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._rows = {}         # task_id -> 行数据
+        self._seq = {}          # task_id -> 插入序号
+        self._pending = []      # 待处理任务堆 [(-优先级, 插入序号, task_id)]，出堆时校验状态，惰性删除
+        self._processing = set()    # 处理中任务，领取时检查其中租约过期的任务
+        self._hashes = {}       # input_hash -> 任务数，去重查询无需扫描全部任务
+        self._next_seq = 0
+        self._log = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                self._replay(path)
+            self._log = open(path, "a", encoding="utf-8")
+
+    def _replay(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                op, data = json.loads(line)
+                for key in ("created_at", "updated_at", "lease_expires_at", "available_at", "deadline"):
+                    if data.get(key):
+                        data[key] = datetime.fromisoformat(data[key])
+                if op == "insert":
+                    self._insert_row(data)
+                else:
+                    self._update_row(data)
+
+    def _append_log(self, op: str, rows: List[dict]):
+        if self._log is None:
+            return
+        for row in rows:
+            self._log.write(json.dumps([op, row], ensure_ascii=False, default=str) + "\n")
+        self._log.flush()
+
+    def _insert_row(self, row: dict):
+        row = {column: row.get(column) for column in TASK_COLUMNS}
+        self._rows[row["task_id"]] = row
+        if row["input_hash"] is not None:
+            self._hashes[row["input_hash"]] = self._hashes.get(row["input_hash"], 0) + 1
+        self._seq[row["task_id"]] = self._next_seq
+        self._next_seq += 1
+        self._track(row)
+
+    def _update_row(self, data: dict):
+        row = self._rows.get(data["task_id"])
+        if row is None:
+            return
+        row.update(data)
+        self._track(row)
+
+    def _track(self, row: dict):
+        if row["status"] == TaskStatus.PROCESSING:
+            self._processing.add(row["task_id"])
+        else:
+            self._processing.discard(row["task_id"])
+            if row["status"] == TaskStatus.PENDING:
+                self._push_pending(row["task_id"])
+
+    def _push_pending(self, task_id: str):
+        heapq.heappush(self._pending, (-(self._rows[task_id]["priority"] or 0), self._seq[task_id], task_id))
+
+    def insert(self, rows: List[dict]):
+        with self._lock:
+            for row in rows:
+                self._insert_row(row)
+            self._append_log("insert", rows)
+
+    def existing_hashes(self, hashes: List[str]) -> set:
+        with self._lock:
+            return {input_hash for input_hash in hashes if input_hash in self._hashes}
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._seq.clear()
+            self._pending.clear()
+            self._processing.clear()
+            self._hashes.clear()
+            if self._log is not None:
+                self._log.truncate(0)
+
+    def claim(self, limit: int, worker_id: str, lease_seconds: float) -> List[ClaimedTask]:
+        with self._lock:
+            now = datetime.now()
+            expired = [{"task_id": task_id, "status": TaskStatus.PENDING, "worker_id": None, "lease_expires_at": None}
+                       for task_id in self._processing
+                       if (self._rows[task_id]["lease_expires_at"] or now) <= now]
+            for data in expired:
+                self._update_row(data)
+            claimed, changes, delayed = [], expired, []
+            lease_expires_at = now + timedelta(seconds=lease_seconds)
+            while self._pending and len(claimed) < limit:
+                entry = heapq.heappop(self._pending)
+                row = self._rows.get(entry[-1])
+                if row is None or row["status"] != TaskStatus.PENDING:
+                    continue
+                if row["available_at"] and row["available_at"] > now:
+                    delayed.append(entry)
+                    continue
+                task_id = row["task_id"]
+                data = {"task_id": task_id, "status": TaskStatus.PROCESSING, "worker_id": worker_id,
+                        "lease_expires_at": lease_expires_at, "updated_at": now}
+                self._update_row(data)
+                claimed.append(ClaimedTask(task_id, row["input_data"], row["retries"], row["deadline"]))
+                changes.append(data)
+            for entry in delayed:
+                heapq.heappush(self._pending, entry)
+            self._append_log("update", changes)
+            return claimed
+
+    def next_available_at(self) -> Optional[datetime]:
+        with self._lock:
+            now = datetime.now()
+            times = [self._rows[task_id]["available_at"] for *_, task_id in self._pending
+                     if self._rows.get(task_id) and self._rows[task_id]["status"] == TaskStatus.PENDING
+                     and self._rows[task_id]["available_at"] and self._rows[task_id]["available_at"] > now]
+            return min(times, default=None)
+
+    def heartbeat(self, task_ids: List[str], worker_id: str, lease_seconds: float) -> int:
+        with self._lock:
+            lease_expires_at = datetime.now() + timedelta(seconds=lease_seconds)
+            changes = [{"task_id": task_id, "lease_expires_at": lease_expires_at} for task_id in task_ids
+                       if self._holds(task_id, worker_id)]
+            for data in changes:
+                self._update_row(data)
+            self._append_log("update", changes)
+            return len(changes)
+
+    def _holds(self, task_id: str, worker_id: str) -> bool:
+        row = self._rows.get(task_id)
+        return row is not None and row["status"] == TaskStatus.PROCESSING and row["worker_id"] == worker_id
+
+    def write_partials(self, results: dict, worker_id: str) -> int:
+        with self._lock:
+            now = datetime.now()
+            changes = [{"task_id": task_id, "result": result, "updated_at": now}
+                       for task_id, result in results.items() if self._holds(task_id, worker_id)]
+            for data in changes:
+                self._update_row(data)
+            self._append_log("update", changes)
+            return len(changes)
+
+    def update(self, updates: List[dict], worker_id: Optional[str] = None):
+        with self._lock:
+            now = datetime.now()
+            changes = [dict(data, worker_id=None, lease_expires_at=None, updated_at=now) for data in updates
+                       if worker_id is None or self._holds(data["task_id"], worker_id)]
+            for data in changes:
+                self._update_row(data)
+            self._append_log("update", changes)
+
+    def count_by_status(self) -> dict:
+        with self._lock:
+            counts = {}
+            for row in self._rows.values():
+                counts[row["status"]] = counts.get(row["status"], 0) + 1
+            return counts
+
+    def get_result(self, task_id: str):
+        with self._lock:
+            row = self._rows.get(task_id)
+            return row["result"] if row else None
+
+    def iter_rows(self, columns: List[str], page_size: int = 1000, status: Optional[str] = None,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None):
+        with self._lock:
+            task_ids = sorted(self._rows)
+        for task_id in task_ids:
+            row = self._rows.get(task_id)
+            if row is None or (status is not None and row["status"] != status):
+                continue
+            if since is not None and row["updated_at"] < since:
+                continue
+            if until is not None and row["updated_at"] >= until:
+                continue
+            yield {name: row[name] for name in columns}
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+# SQLite 存储(SQLAlchemy)在首次访问时才导入，只使用 MemoryTaskStore 时无需加载 SQLAlchemy
+_SQL_NAMES = ("Base", "SQLiteTaskStore", "create_task_model", "migrate_task_table")
+
+
+def __getattr__(name):
+    if name in _SQL_NAMES:
+        from . import sqlite_task_store
+        return getattr(sqlite_task_store, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
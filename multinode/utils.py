@@ -0,0 +1,75 @@
+import json
+import hashlib
+import importlib
+from typing import Optional
+
+
+class LazyModule:
+    """模块代理：首次访问属性时才导入模块，用于推迟 ray / aiohttp 等重量级依赖的导入，缩短包的导入时间"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+class UnhashablePayload(TypeError):
+    """输入中含有无法按内容精确计算哈希的对象(如默认 repr 的自定义对象)，此类输入不参与缓存与去重"""
+
+
+def _canonical(obj):
+    # 转换为带类型标记的 JSON 结构：字典键、列表/元组等容器类型均保留类型，不同输入不会得到相同的表示
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, (list, tuple)):
+        return [type(obj).__name__, [_canonical(item) for item in obj]]
+    if isinstance(obj, dict):
+        items = [[_canonical(key), _canonical(value)] for key, value in obj.items()]
+        return ["dict", sorted(items, key=lambda item: json.dumps(item[0]))]
+    if isinstance(obj, (set, frozenset)):
+        return [type(obj).__name__, sorted((_canonical(item) for item in obj), key=json.dumps)]
+    # 二进制与数组按原始字节计算摘要，避免 str() 截断(如大数组的省略号表示)导致不同内容哈希相同
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return ["bytes", hashlib.sha256(obj).hexdigest()]
+    if callable(getattr(obj, "cpu", None)) and callable(getattr(obj, "numpy", None)):
+        # Torch 张量没有 tobytes，转为 NumPy 数组取字节；bfloat16 等 NumPy 不支持的类型无法转换
+        try:
+            array = obj.detach().cpu().numpy()
+        except (TypeError, RuntimeError) as e:
+            raise UnhashablePayload(f"cannot hash tensor of dtype {obj.dtype}: {e}") from e
+        return ["tensor", str(obj.dtype), list(obj.shape), hashlib.sha256(array.tobytes()).hexdigest()]
+    if hasattr(obj, "tobytes") and hasattr(obj, "shape") and hasattr(obj, "dtype"):
+        if getattr(obj.dtype, "hasobject", False):
+            # object 数组的字节是对象指针，不代表内容
+            raise UnhashablePayload("cannot hash object arrays")
+        return ["array", str(obj.dtype), list(obj.shape), hashlib.sha256(obj.tobytes()).hexdigest()]
+    raise UnhashablePayload(f"cannot hash object of type {type(obj).__name__}")
+
+
+def payload_hash(payload) -> str:
+    """
+    计算输入数据的内容哈希(sha256)，相同内容得到相同哈希，不同内容(含字典键类型、列表与元组之分)得到不同哈希。
+    支持 JSON 基本类型、list / tuple / dict / set、bytes 与 NumPy 数组 / Torch 张量，
+    其他对象无法按内容精确计算哈希，抛出 UnhashablePayload。
+    """
+    data = json.dumps(_canonical(payload), ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def payload_nbytes(payload) -> Optional[int]:
+    """估算输入数据的字节数：数组(含 NumPy / Torch 张量)、bytes 与字符串直接取大小，其他类型返回 None"""
+    if isinstance(payload, (bytes, bytearray, memoryview, str)):
+        return len(payload)
+    nbytes = getattr(payload, "nbytes", None)
+    return nbytes if isinstance(nbytes, int) else None
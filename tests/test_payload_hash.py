@@ -0,0 +1,28 @@
+import pytest
+
+from multinode.cache import ResultCache
+from multinode.utils import UnhashablePayload, payload_hash
+
+
+def test_container_and_key_types_are_distinguished():
+    assert payload_hash({1: "a"}) != payload_hash({"1": "a"})
+    assert payload_hash((1, 2)) != payload_hash([1, 2])
+    assert payload_hash({"a": 1, "b": 2}) == payload_hash({"b": 2, "a": 1})
+
+
+def test_large_arrays_differing_in_the_middle():
+    np = pytest.importorskip("numpy")
+    a = np.zeros(100000)
+    b = a.copy()
+    b[50000] = 1
+    assert payload_hash(a) != payload_hash(b)
+    assert payload_hash(a) != payload_hash(a.astype("float32"))
+
+
+def test_objects_without_content_hash_are_rejected():
+    class Opaque:
+        pass
+
+    with pytest.raises(UnhashablePayload):
+        payload_hash(Opaque())
+    assert ResultCache.key(Opaque()) is None
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta, timezone
+
+from multinode.task_manager import TaskManager
+from multinode.task_store import MemoryTaskStore
+
+
+class EchoEngine:
+    def batch_forward(self, inputs):
+        return list(inputs)
+
+
+def make_manager():
+    return TaskManager("deadline", EchoEngine(), store=MemoryTaskStore(), batch_size=4)
+
+
+def test_aware_deadline_is_stored_as_naive_local_time():
+    manager = make_manager()
+    deadline = datetime.now(timezone.utc) + timedelta(hours=1)
+    manager.load_tasks(range(3), deadline=deadline)
+    claimed = manager.store.claim(10, "w", 60)
+    assert len(claimed) == 3
+    for task in claimed:
+        assert task.deadline.tzinfo is None
+        assert abs(task.deadline - deadline.astimezone().replace(tzinfo=None)) < timedelta(seconds=1)
+
+
+def test_aware_deadline_runs_to_completion():
+    manager = make_manager()
+    manager.load_tasks(range(3), deadline=datetime.now(timezone.utc) + timedelta(hours=1))
+    manager.load_tasks(range(3, 5), clear_existing_data=False,
+                       deadline=datetime.now(timezone(timedelta(hours=-5))) - timedelta(hours=1))
+    manager.run_tasks()
+    status = manager._get_task_status()
+    assert status["completed"] == 3
+    assert status["failed"] == 2
+
+
+def test_float_seconds_deadline():
+    manager = make_manager()
+    before = datetime.now()
+    manager.load_tasks(range(3), deadline=30)
+    manager.load_tasks(range(3, 5), clear_existing_data=False, deadline=-1)
+    deadlines = sorted(task.deadline for task in manager.store.claim(10, "w", 60))
+    assert deadlines[0] < before
+    assert before + timedelta(seconds=29) < deadlines[-1] < datetime.now() + timedelta(seconds=31)
+
+
+def test_float_seconds_deadline_runs_to_completion():
+    manager = make_manager()
+    manager.load_tasks(range(3), deadline=30.0)
+    manager.load_tasks(range(3, 5), clear_existing_data=False, deadline=-1.0)
+    manager.run_tasks()
+    status = manager._get_task_status()
+    assert status["completed"] == 3
+    assert status["failed"] == 2